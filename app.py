@@ -17,12 +17,20 @@ Version : 2.0
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
+import sys
 import calendar
 import locale
+import math
+import random
 import time
+import hashlib
+import threading
+import sqlite3
+import tempfile
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib import colors
 from reportlab.lib.units import cm
@@ -30,8 +38,15 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Image as RL
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER
 from io import BytesIO
+from types import MappingProxyType
 import gspread
+from gspread.exceptions import APIError
+from gspread.utils import ValueRenderOption, DateTimeOption
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import Request
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
 # Configuration du locale français (avec gestion d'erreur pour Streamlit Cloud)
 try:
@@ -104,6 +119,103 @@ def verifier_mot_de_passe():
 SPREADSHEET_ID = "15muR5Bg2cdGfav5RxwKK7kVuC0iPaUoCz9awiKVCa6o"
 SHEET_NAME = "Données"
 
+# Quota de l'API Sheets : 60 requêtes par minute et par utilisateur. Le seau de
+# jetons laisse passer une rafale de CAPACITE_REQUETES puis DEBIT_REQUETES par
+# seconde, soit au plus 60 requêtes sur une minute.
+CAPACITE_REQUETES = 15
+DEBIT_REQUETES = 45 / 60
+# Nouveaux essais sur erreur temporaire (429, 5xx, coupure réseau). Une écriture
+# n'est réessayée que si elle n'a pas pu être appliquée (quota, connexion
+# impossible) : sinon l'erreur remonte et le journal la renvoie plus tard.
+NB_ESSAIS_MAX = 5
+DELAI_ESSAI_BASE = 1.0      # Secondes, doublé à chaque essai
+DELAI_ESSAI_MAX = 32.0
+# Délais d'attente des requêtes (connexion, lecture), en secondes : sans eux une
+# socket bloquée attendrait indéfiniment au lieu d'être réessayée
+DELAI_CONNEXION = 5
+DELAI_LECTURE = 30
+
+@st.cache_resource
+def get_quota_api():
+    """Seau de jetons et compteurs d'appels partagés par toutes les sessions"""
+    return {
+        'verrou': threading.Lock(),
+        'jetons': float(CAPACITE_REQUETES),
+        'derniere_maj': time.monotonic(),
+        'appels': 0,
+        'nouveaux_essais': 0,
+        'limitations': 0          # Réponses 429 ou quota dépassé
+    }
+
+def prendre_jeton_api():
+    """Attend qu'un jeton soit disponible dans le seau partagé, puis le consomme"""
+    quota = get_quota_api()
+    
+    with quota['verrou']:
+        maintenant = time.monotonic()
+        quota['jetons'] = min(
+            CAPACITE_REQUETES,
+            quota['jetons'] + (maintenant - quota['derniere_maj']) * DEBIT_REQUETES
+        )
+        quota['derniere_maj'] = maintenant
+        # Le jeton est réservé tout de suite (le seau peut passer en négatif) :
+        # l'attente se fait hors du verrou, dans l'ordre d'arrivée
+        quota['jetons'] -= 1
+        attente = -quota['jetons'] / DEBIT_REQUETES if quota['jetons'] < 0 else 0
+        quota['appels'] += 1
+    
+    if attente:
+        time.sleep(attente)
+
+def erreur_temporaire(erreur):
+    """Indique si une erreur de l'API mérite un nouvel essai (et si c'est une limitation de quota)"""
+    if isinstance(erreur, (requests.ConnectionError, requests.Timeout)):
+        return True, False
+    
+    code = erreur.response.status_code
+    if code == 429:
+        return True, True
+    if code == 403:
+        # L'API Drive signale ses quotas par un 403
+        try:
+            raisons = {e.get('reason') for e in erreur.response.json()['error'].get('errors', [])}
+        except (ValueError, KeyError, AttributeError):
+            raisons = set()
+        limite = bool(raisons & {'rateLimitExceeded', 'userRateLimitExceeded'})
+        return limite, limite
+    return code >= 500, False
+
+def erreur_avant_envoi(erreur):
+    """Indique si une erreur réseau est survenue avant l'envoi de la requête (connexion impossible)"""
+    if isinstance(erreur, requests.ConnectTimeout):
+        return True
+    raison = getattr(erreur.args[0], 'reason', None) if erreur.args else None
+    return isinstance(erreur, requests.ConnectionError) and isinstance(raison, NewConnectionError)
+
+class HTTPClientQuota(gspread.HTTPClient):
+    """Client HTTP gspread qui respecte le quota partagé et réessaie les erreurs temporaires"""
+    
+    def request(self, method, endpoint, *args, **kwargs):
+        quota = get_quota_api()
+        # Une écriture (batchUpdate : suppressions par numéro de ligne, ajouts) peut
+        # avoir été appliquée malgré l'erreur : la renvoyer la doublerait
+        lecture = method.lower() == 'get'
+        for essai in range(NB_ESSAIS_MAX):
+            prendre_jeton_api()
+            try:
+                return super().request(method, endpoint, *args, **kwargs)
+            except (APIError, requests.ConnectionError, requests.Timeout) as e:
+                temporaire, limitation = erreur_temporaire(e)
+                if not lecture:
+                    temporaire = limitation or erreur_avant_envoi(e)
+                if not temporaire or essai == NB_ESSAIS_MAX - 1:
+                    raise
+                with quota['verrou']:
+                    quota['nouveaux_essais'] += 1
+                    quota['limitations'] += limitation
+            # Attente exponentielle avec gigue, pour que les sessions ne réessaient pas ensemble
+            time.sleep(random.uniform(0, min(DELAI_ESSAI_MAX, DELAI_ESSAI_BASE * 2 ** essai)))
+
 @st.cache_resource
 def get_gsheet_client():
     """Crée la connexion à Google Sheets"""
@@ -117,105 +229,1141 @@ def get_gsheet_client():
             ]
         )
         
-        client = gspread.authorize(credentials)
+        client = gspread.authorize(credentials, http_client=HTTPClientQuota)
+        client.set_timeout((DELAI_CONNEXION, DELAI_LECTURE))
+        
+        # Une seule session HTTP gardée ouverte (keep-alive), partagée par les
+        # pages et les threads d'arrière-plan
+        client.http_client.session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=8))
         return client
     except Exception as e:
         st.error(f"❌ Erreur de connexion à Google Sheets : {e}")
         return None
 
-# ==================== FONCTIONS UTILES ====================
+# Marge avant expiration à partir de laquelle le jeton d'accès est renouvelé (en secondes)
+MARGE_RENOUVELLEMENT_JETON = 300
 
-@st.cache_data(ttl=10)
-def charger_donnees():
-    """Charge les données depuis Google Sheets"""
-    try:
-        client = get_gsheet_client()
-        if not client:
-            return None
-        
-        # Ouvrir le spreadsheet
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        worksheet = spreadsheet.worksheet(SHEET_NAME)
-        
-        # Récupérer toutes les données (ligne par ligne)
-        all_values = worksheet.get_all_values()
-        
-        if not all_values or len(all_values) < 2:
-            st.warning("⚠️ Aucune donnée trouvée dans Google Sheets")
-            return None
-        
-        # La première ligne contient les en-têtes, les autres sont les données
-        headers = all_values[0]
-        data_rows = all_values[1:]
-        
-        # Créer le DataFrame manuellement
-        df = pd.DataFrame(data_rows, columns=headers)
-        
-        # Compter les lignes initiales
-        nb_lignes_initiales = len(df)
-        
-        # Identifier les colonnes (même avec doublons, on prend les indices)
-        # Colonnes attendues : A=Clé, B=Année, C=Date, D=Jour, E=Mois, F=Valeur, G=Nb_Collaborateurs
+@st.cache_resource
+def get_verrou_jeton():
+    """Verrou du renouvellement du jeton, partagé par les threads d'arrière-plan"""
+    return threading.Lock()
+
+def renouveler_jeton():
+    """Renouvelle le jeton d'accès avant qu'il n'expire.
+    
+    Appelé depuis les threads d'arrière-plan, pour qu'une lecture ou une
+    écriture n'ait jamais à attendre ce renouvellement. Le verrou évite que
+    deux threads renouvellent le même jeton en même temps.
+    """
+    if TYPE_STOCKAGE == "local":
+        return
+    
+    client = get_gsheet_client()
+    if not client:
+        return
+    
+    credentials = client.http_client.auth
+    with get_verrou_jeton():
+        maintenant = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth travaille en UTC naïf
+        if (not credentials.valid or credentials.expiry is None
+                or credentials.expiry - maintenant < timedelta(seconds=MARGE_RENOUVELLEMENT_JETON)):
+            # Transport simple, hors de la session du client (authentifiée et soumise au quota)
+            credentials.refresh(Request())
+
+# ==================== STOCKAGE DES DONNÉES ====================
+
+# Stockage utilisé : "sheets" (Google Sheets) ou "local" (fichier SQLite aux
+# mêmes colonnes A à G, pour travailler et mesurer les performances hors ligne)
+TYPE_STOCKAGE = os.environ.get("ATELIER_STOCKAGE", "sheets")
+FICHIER_STOCKAGE_LOCAL = os.environ.get("ATELIER_FICHIER_LOCAL", os.path.join(".streamlit", "stockage_local.sqlite"))
+
+# Les deux stockages offrent les mêmes opérations, sur des lignes numérotées
+# comme dans le sheet (ligne 1 = en-tête) :
+#   lire(plage)             lignes d'une plage A1 ("A1:G", "A12:G", "C5")
+#   lire_plusieurs(plages)  résultats de lire pour plusieurs plages, en une requête
+#   ecrire(mises_a_jour, suppressions, ajouts)  en une seule opération
+#   date_modification()     change à chaque écriture, sans lire de cellule
+
+EN_TETE_SHEET = ['Clé', 'Année', 'Date', 'Jour', 'Mois', 'Valeur', 'Nb_Collaborateurs']
+COLONNES_SHEET = 'ABCDEFG'
+
+def cellule_sheet(valeur):
+    """Cellule au format de l'API batchUpdate"""
+    if isinstance(valeur, str):
+        return {'userEnteredValue': {'stringValue': valeur}}
+    return {'userEnteredValue': {'numberValue': valeur}}
+
+class StockageSheets:
+    """Onglet des données du spreadsheet Google Sheets"""
+    
+    def __init__(self, client, feuille):
+        self.client = client
+        self.feuille = feuille
+    
+    def lire(self, plage):
+        """Lit une plage en valeurs brutes (nombres, dates en numéro de série)"""
+        return self.feuille.get(
+            plage,
+            value_render_option=ValueRenderOption.unformatted,
+            date_time_render_option=DateTimeOption.serial_number
+        )
+    
+    def lire_plusieurs(self, plages):
+        """Lit plusieurs plages en valeurs brutes, en une seule requête"""
+        return self.feuille.batch_get(
+            plages,
+            value_render_option=ValueRenderOption.unformatted,
+            date_time_render_option=DateTimeOption.serial_number
+        )
+    
+    def ecrire(self, mises_a_jour, suppressions, ajouts):
+        """Une seule requête batchUpdate : mises à jour (F:G), suppressions du bas vers le haut, puis ajouts"""
+        requetes = [{
+            'updateCells': {
+                'start': {'sheetId': self.feuille.id, 'rowIndex': ligne - 1, 'columnIndex': 5},
+                'rows': [{'values': [cellule_sheet(montant), cellule_sheet(nb_collaborateurs)]}],
+                'fields': 'userEnteredValue'
+            }
+        } for ligne, montant, nb_collaborateurs in mises_a_jour]
+        requetes += [{
+            'deleteDimension': {
+                'range': {'sheetId': self.feuille.id, 'dimension': 'ROWS', 'startIndex': ligne - 1, 'endIndex': ligne}
+            }
+        } for ligne in sorted(suppressions, reverse=True)]
+        if ajouts:
+            requetes.append({
+                'appendCells': {
+                    'sheetId': self.feuille.id,
+                    'rows': [{'values': [cellule_sheet(valeur) for valeur in ligne]} for ligne in ajouts],
+                    'fields': 'userEnteredValue'
+                }
+            })
         
-        # Traiter les colonnes par index pour éviter les problèmes de noms
-        if len(df.columns) >= 7:
-            df['date'] = pd.to_datetime(df.iloc[:, 2], errors='coerce', dayfirst=True)  # Colonne C (index 2)
-            
-            # Nettoyage robuste des montants (colonne F = index 5)
-            def nettoyer_montant(valeur):
-                if pd.isna(valeur) or valeur == '' or valeur == '0':
-                    return 0
-                
-                if isinstance(valeur, (int, float)):
-                    return float(valeur)
-                
-                if isinstance(valeur, str):
-                    import re
-                    valeur_nettoyee = re.sub(r'[^\d,.-]', '', valeur)
-                    valeur_nettoyee = valeur_nettoyee.replace(',', '.')
-                    try:
-                        return float(valeur_nettoyee)
-                    except:
-                        return 0
-                
-                return 0
+        if requetes:
+            self.feuille.spreadsheet.batch_update({'requests': requetes})
+    
+    def date_modification(self):
+        """Date de modification Drive du spreadsheet"""
+        return self.client.get_file_drive_metadata(SPREADSHEET_ID)['modifiedTime']
+
+def decouper_plage(plage):
+    """Colonnes (0 à 6) et lignes d'une plage A1 : "A2:G" → (0, 2, 6, None)"""
+    debut, _, fin = plage.partition(':')
+    fin = fin or debut
+    return (
+        COLONNES_SHEET.index(debut[0]), int(debut[1:]),
+        COLONNES_SHEET.index(fin[0]), int(fin[1:]) if fin[1:] else None
+    )
+
+class StockageLocal:
+    """Sheet simulé dans un fichier SQLite : mêmes lignes A à G, valeurs gardées telles qu'écrites.
+    
+    Le fichier est créé avec la seule ligne d'en-tête ; le bouton « Copier le
+    sheet en local » de la page Données brutes y recopie le vrai sheet.
+    """
+    
+    def __init__(self, chemin):
+        self.chemin = chemin
+        conn = self.connexion()
+        try:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS lignes (ligne INTEGER PRIMARY KEY, a, b, c, d, e, f, g)")
+                conn.execute("CREATE TABLE IF NOT EXISTS meta (cle TEXT PRIMARY KEY, valeur INTEGER)")
+                conn.execute("INSERT OR IGNORE INTO meta VALUES ('modification', 0)")
+                conn.execute("INSERT OR IGNORE INTO lignes VALUES (1, ?, ?, ?, ?, ?, ?, ?)", EN_TETE_SHEET)
+        finally:
+            conn.close()
+    
+    def connexion(self):
+        """Ouvre le fichier SQLite (créé au besoin)"""
+        dossier = os.path.dirname(self.chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        return sqlite3.connect(self.chemin, timeout=10)
+    
+    def lire(self, plage):
+        """Lit une plage comme l'API : lignes vides intermédiaires gardées, cellules vides de fin retirées"""
+        colonne_debut, ligne_debut, colonne_fin, ligne_fin = decouper_plage(plage)
+        colonnes = ', '.join(COLONNES_SHEET[colonne_debut:colonne_fin + 1].lower())
+        requete = f"SELECT ligne, {colonnes} FROM lignes WHERE ligne >= ?"
+        parametres = [ligne_debut]
+        if ligne_fin is not None:
+            requete += " AND ligne <= ?"
+            parametres.append(ligne_fin)
+        
+        conn = self.connexion()
+        try:
+            resultats = conn.execute(requete + " ORDER BY ligne", parametres).fetchall()
+        finally:
+            conn.close()
+        
+        lignes = []
+        for numero, *cellules in resultats:
+            cellules = ['' if valeur is None else valeur for valeur in cellules]
+            while cellules and cellules[-1] == '':
+                cellules.pop()
+            lignes.extend([[]] * (numero - ligne_debut - len(lignes)))
+            lignes.append(cellules)
+        while lignes and not lignes[-1]:
+            lignes.pop()
+        return lignes
+    
+    def lire_plusieurs(self, plages):
+        """Lit plusieurs plages"""
+        return [self.lire(plage) for plage in plages]
+    
+    def ecrire(self, mises_a_jour, suppressions, ajouts):
+        """Mises à jour (F:G), suppressions du bas vers le haut, puis ajouts, en une transaction"""
+        conn = self.connexion()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE lignes SET f = ?, g = ? WHERE ligne = ?",
+                    [(montant, nb_collaborateurs, ligne) for ligne, montant, nb_collaborateurs in mises_a_jour]
+                )
+                for ligne in sorted(suppressions, reverse=True):
+                    conn.execute("DELETE FROM lignes WHERE ligne = ?", (ligne,))
+                    # Remontée des lignes suivantes, en deux temps pour ne pas heurter la clé primaire
+                    conn.execute("UPDATE lignes SET ligne = -(ligne - 1) WHERE ligne > ?", (ligne,))
+                    conn.execute("UPDATE lignes SET ligne = -ligne WHERE ligne < 0")
+                if ajouts:
+                    derniere = conn.execute("SELECT COALESCE(MAX(ligne), 0) FROM lignes").fetchone()[0]
+                    conn.executemany(
+                        "INSERT INTO lignes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [(derniere + i + 1, *ligne) for i, ligne in enumerate(ajouts)]
+                    )
+                conn.execute("UPDATE meta SET valeur = valeur + 1 WHERE cle = 'modification'")
+        finally:
+            conn.close()
+    
+    def remplacer(self, lignes):
+        """Remplace tout le contenu par des lignes brutes (en-tête comprise)"""
+        conn = self.connexion()
+        try:
+            with conn:
+                conn.execute("DELETE FROM lignes")
+                conn.executemany(
+                    "INSERT INTO lignes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(i + 1, *(list(ligne)[:NB_COLONNES] + [''] * (NB_COLONNES - len(ligne))))
+                     for i, ligne in enumerate(lignes)]
+                )
+                conn.execute("UPDATE meta SET valeur = valeur + 1 WHERE cle = 'modification'")
+        finally:
+            conn.close()
+    
+    def date_modification(self):
+        """Compteur d'écritures du fichier"""
+        conn = self.connexion()
+        try:
+            return conn.execute("SELECT valeur FROM meta WHERE cle = 'modification'").fetchone()[0]
+        finally:
+            conn.close()
+
+@st.cache_resource
+def get_poignees():
+    """Poignée du stockage partagée entre sessions"""
+    return {
+        'verrou': threading.Lock(),
+        'stockage': None
+    }
+
+def ouvrir_stockage():
+    """Stockage des données choisi par TYPE_STOCKAGE, ouvert une seule fois puis réutilisé.
+    
+    Pour Google Sheets, ouvrir le spreadsheet puis l'onglet coûte deux requêtes
+    de métadonnées : la poignée est gardée pour que chaque lecture ou écriture
+    n'en fasse qu'une.
+    """
+    poignees = get_poignees()
+    
+    with poignees['verrou']:
+        if poignees['stockage'] is None and TYPE_STOCKAGE == "local":
+            poignees['stockage'] = StockageLocal(FICHIER_STOCKAGE_LOCAL)
+        elif poignees['stockage'] is None:
+            client = get_gsheet_client()
+            if not client:
+                return None
+            poignees['stockage'] = StockageSheets(client, client.open_by_key(SPREADSHEET_ID).worksheet(SHEET_NAME))
+        return poignees['stockage']
+
+def oublier_stockage():
+    """Force la réouverture du stockage au prochain accès (après une erreur : onglet renommé, droits...)"""
+    get_poignees()['stockage'] = None
+
+# ==================== SYNCHRONISATION INCRÉMENTALE ====================
+
+# Colonnes utilisées : A=Clé, B=Année, C=Date, D=Jour, E=Mois, F=Valeur, G=Nb_Collaborateurs
+NB_COLONNES = 7
+# Nombre de dernières lignes déjà connues relues à chaque synchronisation (contrôle)
+NB_LIGNES_CONTROLE = 10
+# Colonnes relues sur tout l'historique à chaque synchronisation (Date, Valeur et
+# Nb_Collaborateurs, toutes celles qu'utilise l'application) : une modification ou
+# une suppression de ligne n'importe où change leur empreinte.
+COLONNES_CONTROLE = ('C', 'F', 'G')
+# Essais de synchronisation quand les lignes en mémoire changent pendant la lecture
+NB_ESSAIS_SYNCHRO = 3
+# Délai maximum entre deux rechargements complets du sheet (en secondes)
+DELAI_RECHARGEMENT_COMPLET = 600
+# Intervalle entre deux contrôles de la date de modification du sheet (en secondes) :
+# il double à chaque contrôle sans changement, dans ces bornes
+INTERVALLE_VERIFICATION_MIN = 10
+INTERVALLE_VERIFICATION_MAX = 300
+# Attente maximale d'un rafraîchissement par une session ou par l'envoi du journal,
+# et durée au-delà de laquelle un rafraîchissement est tenu pour bloqué et relancé
+DELAI_ATTENTE_RAFRAICHISSEMENT = 60
+DELAI_RAFRAICHISSEMENT_BLOQUE = 300
+
+@st.cache_resource
+def get_etat_synchro():
+    """État partagé (entre sessions) de la synchronisation avec Google Sheets"""
+    return {
+        'verrou': threading.Lock(),
+        'valeurs': [],            # Lignes brutes du sheet, en-tête comprise
+        'version': None,          # Empreinte des lignes brutes (version des données)
+        'dernier_complet': 0.0,   # Horodatage du dernier rechargement complet
+        'version_instantane': None,
+        'date_instantane': None,  # Date de sauvegarde de l'instantané local
+        'verrou_rafraichissement': threading.Lock(),
+        'rafraichissement': None,       # Thread de rafraîchissement en cours
+        'debut_rafraichissement': 0.0,  # Horodatage (time.monotonic) de son lancement
+        'erreur_rafraichissement': None,
+        'date_donnees': None,     # Dernier contrôle réussi des données auprès de Google Sheets
+        'rapport': None,          # Bilan du dernier nettoyage des lignes
+        'taille_lignes_brutes': 0,      # Mémoire des lignes brutes, mesurée à chaque nouvelle version
+        'donnees': None,          # Données préparées pour la dernière version chargée
+        'donnees_instantane': None,     # Données préparées depuis l'instantané, en attendant la synchro
+        'index_lignes': {},       # Date → numéro de ligne dans le sheet
+        'version_index': None,
+        'date_modification': None,      # Date de modification Drive des lignes synchronisées
+        'date_modification_vue': None,  # Dernière date de modification Drive constatée
+        'intervalle': INTERVALLE_VERIFICATION_MIN,
+        'prochaine_verification': 0.0
+    }
+
+def normaliser_ligne(ligne):
+    """Ramène une ligne brute du sheet aux colonnes A à G.
+    
+    Les nombres entiers sont gardés sans décimale, comme les renvoie l'API.
+    """
+    ligne = [int(v) if isinstance(v, float) and v.is_integer() else v for v in list(ligne)[:NB_COLONNES]]
+    return ligne + [''] * (NB_COLONNES - len(ligne))
+
+def empreinte_lignes(lignes):
+    """Calcule une empreinte (checksum) d'un bloc de lignes du sheet"""
+    return hashlib.md5(repr(lignes).encode('utf-8')).hexdigest()
+
+def forcer_rechargement_complet():
+    """Force un rechargement complet du sheet à la prochaine synchronisation"""
+    get_etat_synchro()['dernier_complet'] = 0.0
+
+def empreinte_colonne(valeurs, nb_lignes):
+    """Empreinte des valeurs d'une colonne, complétées par des cellules vides jusqu'à nb_lignes"""
+    return empreinte_lignes(list(valeurs) + [''] * (nb_lignes - len(valeurs)))
+
+def synchroniser_valeurs(stockage):
+    """Met à jour les lignes brutes en ne téléchargeant que la fin du sheet.
+    
+    Les dernières lignes déjà connues sont relues avec les nouvelles, et les
+    colonnes de COLONNES_CONTROLE sur tout l'historique dans la même requête : si une
+    empreinte a changé (modification, suppression de ligne...), on recharge tout.
+    Les lectures se font hors du verrou ; le résultat n'est installé que si les
+    lignes en mémoire n'ont pas changé entre-temps (sinon on recommence).
+    """
+    etat = get_etat_synchro()
+    
+    for _ in range(NB_ESSAIS_SYNCHRO):
+        with etat['verrou']:
+            valeurs, version = etat['valeurs'], etat['version']
+            delai_depasse = time.time() - etat['dernier_complet'] > DELAI_RECHARGEMENT_COMPLET
+        nb_lignes_connues = len(valeurs)
+        
+        if nb_lignes_connues >= 2 and not delai_depasse:
+            # Plage relue : lignes de contrôle + nouvelles lignes éventuelles
+            debut = max(2, nb_lignes_connues - NB_LIGNES_CONTROLE + 1)
+            nb_controle = nb_lignes_connues - debut + 1
+            fin_sheet, *colonnes = stockage.lire_plusieurs(
+                [f"A{debut}:G"] + [f"{colonne}2:{colonne}{nb_lignes_connues}" for colonne in COLONNES_CONTROLE]
+            )
+            fin_sheet = [normaliser_ligne(ligne) for ligne in fin_sheet]
+            historique_intact = all(
+                empreinte_colonne([normaliser_ligne(ligne)[0] for ligne in lues], nb_lignes_connues - 1)
+                == empreinte_colonne([ligne[COLONNES_SHEET.index(colonne)] for ligne in valeurs[1:]], nb_lignes_connues - 1)
+                for colonne, lues in zip(COLONNES_CONTROLE, colonnes)
+            )
             
-            df['montant'] = df.iloc[:, 5].apply(nettoyer_montant)  # Colonne F (index 5)
-            df['nb_collaborateurs'] = pd.to_numeric(df.iloc[:, 6], errors='coerce').fillna(0).astype(int)  # Colonne G (index 6)
+            if (historique_intact and len(fin_sheet) >= nb_controle and
+                    empreinte_lignes(fin_sheet[:nb_controle]) == empreinte_lignes(valeurs[debut - 1:])):
+                nouvelles_lignes = fin_sheet[nb_controle:]
+                with etat['verrou']:
+                    if etat['version'] != version:
+                        continue  # Saisie reportée pendant la lecture : on relit
+                    if nouvelles_lignes:
+                        etat['valeurs'] = valeurs + nouvelles_lignes
+                        etat['version'] = empreinte_lignes(etat['valeurs'])
+                    return etat['valeurs']
+        
+        # Rechargement complet (premier chargement, délai dépassé ou empreinte différente)
+        all_values = stockage.lire("A1:G")
+        if all_values:
+            valeurs_sheet = [all_values[0]] + [normaliser_ligne(ligne) for ligne in all_values[1:]]
         else:
-            st.error(f"❌ Structure du sheet incorrecte. Colonnes trouvées : {len(df.columns)}")
-            return None
-        
-        # Compter combien de lignes sont perdues
-        nb_dates_invalides = df['date'].isna().sum()
-        nb_montants_nuls = (df['montant'] == 0).sum()
-        
-        # Filtrer uniquement les lignes où date ET montant sont valides
-        df = df.dropna(subset=['date'])
-        df = df[df['montant'] > 0]  # On garde seulement les montants > 0
-        nb_lignes_finales = len(df)
-        
-        # Sélectionner seulement les colonnes nécessaires
-        df = df[['date', 'montant', 'nb_collaborateurs']].copy()
-        
-        # Détection et correction automatique si nécessaire
-        if len(df) > 0:
-            montants_non_nuls = df['montant']
-            if len(montants_non_nuls) > 0:
-                moyenne = montants_non_nuls.mean()
-                
-                # Si la moyenne est > 1000€, diviser par 100
-                if moyenne > 1000:
-                    df['montant'] = df['montant'] / 100
-                    st.info("✅ Correction automatique appliquée aux montants")
-        
-        df = df.dropna(subset=['date', 'montant'])
-        df = df[['date', 'montant', 'nb_collaborateurs']].copy()
-        
-        return df
+            valeurs_sheet = []
+        with etat['verrou']:
+            if etat['version'] != version:
+                continue
+            etat['valeurs'] = valeurs_sheet
+            etat['version'] = empreinte_lignes(valeurs_sheet)
+            etat['dernier_complet'] = time.time()
+            return etat['valeurs']
+    
+    # Lignes modifiées à chaque essai : la prochaine synchronisation rechargera tout
+    forcer_rechargement_complet()
+    return etat['valeurs']
+
+def verifier_modifications():
+    """Contrôle léger du sheet par sa date de modification, à intervalle adaptatif.
+    
+    Ne télécharge aucune cellule. L'intervalle revient au minimum dès qu'un
+    changement est constaté et double à chaque contrôle sans changement.
+    """
+    etat = get_etat_synchro()
+    maintenant = time.time()
+    if maintenant < etat['prochaine_verification']:
+        return
+    
+    stockage = ouvrir_stockage()
+    if stockage is None:
+        return
+    date_modification = stockage.date_modification()
+    
+    if date_modification != etat['date_modification_vue']:
+        etat['date_modification_vue'] = date_modification
+        etat['intervalle'] = INTERVALLE_VERIFICATION_MIN
+    else:
+        etat['intervalle'] = min(2 * etat['intervalle'], INTERVALLE_VERIFICATION_MAX)
+    etat['prochaine_verification'] = maintenant + etat['intervalle']
+
+def synchroniser_modifications(stockage):
+    """Synchronise les lignes brutes après un changement constaté par verifier_modifications.
+    
+    Les empreintes de synchroniser_valeurs couvrent toutes les colonnes
+    utilisées : une modification n'importe où dans le sheet y est vue, sans
+    avoir à deviner d'où vient le changement de date de modification.
+    """
+    etat = get_etat_synchro()
+    date_vue = etat['date_modification_vue']
+    
+    valeurs = synchroniser_valeurs(stockage)
+    etat['date_modification'] = date_vue
+    return valeurs
+
+# ==================== INSTANTANÉ LOCAL ====================
+
+# Copie locale des données nettoyées, pour un affichage immédiat au démarrage
+DOSSIER_CACHE = ".streamlit/cache"
+FICHIER_INSTANTANE = os.path.join(DOSSIER_CACHE, "donnees.sqlite")
+
+def sauvegarder_instantane(df, version):
+    """Enregistre le DataFrame nettoyé et sa version dans l'instantané SQLite"""
+    os.makedirs(DOSSIER_CACHE, exist_ok=True)
+    
+    # Écriture dans un fichier temporaire puis remplacement atomique
+    fd, chemin_temp = tempfile.mkstemp(dir=DOSSIER_CACHE, suffix=".tmp")
+    os.close(fd)
+    try:
+        with sqlite3.connect(chemin_temp) as conn:
+            donnees = df[['date', 'montant', 'nb_collaborateurs']].copy()
+            donnees['date'] = donnees['date'].dt.strftime('%Y-%m-%d')
+            donnees['montant'] = montants_euros(donnees)
+            donnees.to_sql('donnees', conn, index=False)
+            conn.execute("CREATE TABLE meta (cle TEXT PRIMARY KEY, valeur TEXT)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('version', version),
+                ('date_sauvegarde', datetime.now().isoformat(timespec='seconds'))
+            ])
+        conn.close()
+        os.replace(chemin_temp, FICHIER_INSTANTANE)
+    except Exception:
+        os.remove(chemin_temp)
+        raise
+    
+    get_etat_synchro()['version_instantane'] = version
+
+def charger_instantane():
+    """Charge le DataFrame depuis l'instantané SQLite (None s'il n'existe pas)"""
+    if not os.path.exists(FICHIER_INSTANTANE):
+        return None
+    
+    try:
+        conn = sqlite3.connect(FICHIER_INSTANTANE)
+        try:
+            df = pd.read_sql("SELECT date, montant, nb_collaborateurs FROM donnees", conn)
+            meta = dict(conn.execute("SELECT cle, valeur FROM meta").fetchall())
+        finally:
+            conn.close()
+    except (sqlite3.Error, pd.errors.DatabaseError):
+        return None
+    
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    df = df.astype(TYPES_DONNEES)
+    
+    etat = get_etat_synchro()
+    etat['version_instantane'] = meta.get('version')
+    etat['date_instantane'] = meta.get('date_sauvegarde')
+    return df
+
+# ==================== RAFRAÎCHISSEMENT EN ARRIÈRE-PLAN ====================
+
+# Les pages sont servies depuis les dernières données préparées ; le contrôle
+# et la synchronisation avec Google Sheets se font dans un thread à part
+
+def rafraichir_donnees(etat):
+    """Contrôle et synchronise les données avec Google Sheets, puis les prépare (exécuté en arrière-plan)"""
+    try:
+        renouveler_jeton()
+        if etat['valeurs']:
+            verifier_modifications()
+        
+        if (not etat['valeurs'] or not etat['dernier_complet']
+                or etat['date_modification_vue'] != etat['date_modification']):
+            stockage = ouvrir_stockage()
+            if stockage is None:
+                raise ConnectionError("Impossible d'ouvrir le stockage des données")
+            synchroniser_modifications(stockage)
+        
+        with etat['verrou']:
+            valeurs, version = etat['valeurs'], etat['version']
+            a_preparer = etat['donnees'] is None or etat['donnees']['version'] != version
+        
+        if a_preparer:
+            df, rapport = nettoyer_valeurs(valeurs)
+            donnees = preparer_donnees(df, version)
+            taille_brute = taille_lignes_brutes(valeurs)
+            with etat['verrou']:
+                if etat['version'] == version:
+                    etat['donnees'], etat['rapport'] = donnees, rapport
+                    etat['taille_lignes_brutes'] = taille_brute
+                    etat['donnees_instantane'] = None
+                else:
+                    etat['prochaine_verification'] = 0.0  # Saisie arrivée entre-temps : on recommence
+        
+        # Mettre à jour l'instantané local si les données ont changé
+        mettre_a_jour_instantane(etat)
+        etat['erreur_rafraichissement'] = None
+        etat['date_donnees'] = datetime.now()
     except Exception as e:
-        st.error(f"❌ Erreur lors du chargement : {e}")
+        oublier_stockage()
+        etat['erreur_rafraichissement'] = str(e)
+        etat['prochaine_verification'] = time.time() + etat['intervalle']
+    finally:
+        with etat['verrou_rafraichissement']:
+            # Un thread tenu pour bloqué a déjà été remplacé : il ne libère pas la place du suivant
+            if etat['rafraichissement'] is threading.current_thread():
+                etat['rafraichissement'] = None
+
+def lancer_rafraichissement(attendre=False):
+    """Lance le rafraîchissement en arrière-plan s'il n'est pas déjà en cours.
+    
+    Un seul thread à la fois pour toutes les sessions : une session qui arrive
+    pendant un téléchargement ne le relance pas. Un thread qui tourne depuis
+    plus de DELAI_RAFRAICHISSEMENT_BLOQUE est abandonné et remplacé.
+    Avec attendre, retourne False si le rafraîchissement n'est pas terminé
+    après DELAI_ATTENTE_RAFRAICHISSEMENT (il continue en arrière-plan).
+    """
+    etat = get_etat_synchro()
+    
+    with etat['verrou_rafraichissement']:
+        bloque = time.monotonic() - etat['debut_rafraichissement'] > DELAI_RAFRAICHISSEMENT_BLOQUE
+        if etat['rafraichissement'] is None or bloque:
+            etat['rafraichissement'] = threading.Thread(
+                target=rafraichir_donnees, args=(etat,), daemon=True
+            )
+            etat['debut_rafraichissement'] = time.monotonic()
+            etat['rafraichissement'].start()
+        thread = etat['rafraichissement']
+    
+    if attendre:
+        thread.join(DELAI_ATTENTE_RAFRAICHISSEMENT)
+        return not thread.is_alive()
+    return True
+
+# ==================== FONCTIONS UTILES ====================
+
+# Types compacts des colonnes nettoyées : un montant tient au centime près en
+# float32 (jusqu'à 100 000 €), un nombre de collaborateurs en int8
+TYPES_DONNEES = {'montant': 'float32', 'nb_collaborateurs': 'int8'}
+# Bornes du nombre de collaborateurs (int8) : une cellule hors bornes ou non
+# entière est ramenée dedans au chargement, et comptée dans le rapport
+NB_COLLABORATEURS_MAX = 127
+
+def montants_euros(df):
+    """Montants en float64 arrondis au centime, pour les sommes (sans l'imprécision du float32)"""
+    return np.round(df['montant'].to_numpy(dtype=float), 2)
+
+def convertir_montants(valeurs):
+    """Convertit une colonne de montants en float, en une seule passe vectorisée.
+    
+    Accepte les nombres et les textes au format français ("1 234,50 €").
+    Quand un texte contient virgule et point, le dernier des deux est le
+    séparateur décimal ("1.234,50" comme "1,234.50") ; un texte qui reste
+    ambigu ("1,234,567") est rejeté plutôt que lu de travers.
+    Retourne les montants (0 pour les cellules vides ou illisibles) et le
+    nombre de cellules non vides rejetées.
+    """
+    montants = pd.to_numeric(valeurs, errors='coerce').astype(float)
+    
+    # Cellules texte : retirer symboles et espaces, puis séparateurs de milliers,
+    # et ramener le séparateur décimal à un point
+    a_nettoyer = montants.isna() & valeurs.notna()
+    if a_nettoyer.any():
+        texte = valeurs[a_nettoyer].astype(str).str.replace(r'[^\d,.-]', '', regex=True)
+        decimale_virgule = texte.str.rfind(',') > texte.str.rfind('.')
+        texte = texte.mask(
+            decimale_virgule,
+            texte.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)  # "1.234,50"
+        ).mask(~decimale_virgule, texte.str.replace(',', '', regex=False))         # "1,234.50"
+        montants[a_nettoyer] = pd.to_numeric(texte, errors='coerce')
+    
+    vides = valeurs.isna() | (valeurs.astype(str).str.strip() == '')
+    nb_rejetes = int((montants.isna() & ~vides).sum())
+    return montants.fillna(0), nb_rejetes
+
+# Origine des numéros de série de dates de Google Sheets
+ORIGINE_DATES_SHEETS = pd.Timestamp('1899-12-30')
+
+def convertir_dates(valeurs):
+    """Convertit la colonne Date du sheet, en une seule passe vectorisée.
+    
+    Les vraies dates arrivent en numéro de série ; les textes au format
+    d/m/yyyy écrit par l'application sont lus avec ce format explicite.
+    Seules les autres cellules passent par la détection automatique (plus
+    lente). Retourne les dates et le nombre de cellules concernées.
+    """
+    numeros = pd.to_numeric(valeurs, errors='coerce')
+    dates = pd.to_datetime(numeros, unit='D', origin=ORIGINE_DATES_SHEETS).dt.normalize()
+    
+    textes = dates.isna() & valeurs.notna()
+    if textes.any():
+        dates[textes] = pd.to_datetime(valeurs[textes], format='%d/%m/%Y', errors='coerce')
+    
+    a_deviner = dates.isna() & valeurs.notna() & (valeurs.astype(str).str.strip() != '')
+    nb_repli = int(a_deviner.sum())
+    if nb_repli:
+        # Dates ISO (aaaa-mm-jj) en priorité, sinon détection cellule par cellule
+        restantes = valeurs[a_deviner]
+        dates_iso = pd.to_datetime(restantes, format='ISO8601', errors='coerce')
+        dates[a_deviner] = dates_iso.fillna(
+            pd.to_datetime(restantes, format='mixed', dayfirst=True, errors='coerce')
+        )
+    
+    return dates, nb_repli
+
+# Noms des jours renvoyés par pandas (dt.day_name), du lundi au dimanche
+JOURS_SEMAINE = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+JOURS_SEMAINE_FR = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+
+def ajouter_colonnes_calculees(df):
+    """Ajoute les colonnes dérivées de la date (exercice, année, mois, jour de la semaine)"""
+    annee = df['date'].dt.year
+    mois = df['date'].dt.month
+    
+    # Exercice fiscal de juillet à juin : libellé "2024/2025" calculé une fois par année de début
+    annee_debut_exercice = annee - (mois < 7)
+    libelles = {a: f"{a}/{a + 1}" for a in annee_debut_exercice.unique()}
+    df['exercice'] = annee_debut_exercice.map(libelles).astype('category')
+    
+    df['annee'] = annee.astype('int16')
+    df['mois'] = mois.astype('int8')
+    df['jour_semaine'] = pd.Categorical.from_codes(df['date'].dt.dayofweek, categories=JOURS_SEMAINE)
+    return df
+
+def indexer_par_date(df):
+    """Trie les données par date et les indexe par date (DatetimeIndex trié)"""
+    df = df.sort_values('date', kind='stable')
+    df.index = pd.DatetimeIndex(df['date'].to_numpy())
+    return df
+
+def bornes_dates(df, debut, fin):
+    """Positions [i, j[ des lignes entre deux dates incluses, par recherche dichotomique sur l'index trié"""
+    i = df.index.searchsorted(pd.Timestamp(debut), side='left')
+    j = df.index.searchsorted(pd.Timestamp(fin), side='right')
+    return i, j
+
+def construire_ca_journalier(df):
+    """Construit le CA jour par jour sur un calendrier continu, avec ses cumuls.
+    
+    Le total d'une période se lit alors par simple différence de deux cumuls.
+    """
+    if df.empty:
+        debut, nb_jours, positions = pd.Timestamp(datetime.now().date()), 0, np.array([], dtype=int)
+    else:
+        debut = df['date'].iloc[0]
+        positions = ((df['date'] - debut) // pd.Timedelta(days=1)).to_numpy()
+        nb_jours = int(positions[-1]) + 1
+    
+    ca = np.bincount(positions, weights=montants_euros(df), minlength=nb_jours)
+    nb_lignes = np.bincount(positions, minlength=nb_jours)
+    nb_collaborateurs = np.zeros(nb_jours, dtype=int)
+    np.maximum.at(nb_collaborateurs, positions, df['nb_collaborateurs'].to_numpy(dtype=int))
+    
+    return {
+        'debut': debut,
+        'ca': ca,
+        'nb_collaborateurs': nb_collaborateurs,
+        'cumul_ca': np.concatenate(([0.0], np.cumsum(ca))),
+        'cumul_lignes': np.concatenate(([0], np.cumsum(nb_lignes)))
+    }
+
+def bornes_periode(journalier, debut, fin):
+    """Positions [i, j[ des jours compris entre deux dates incluses"""
+    nb_jours = len(journalier['ca'])
+    jour = pd.Timedelta(days=1)
+    i = math.ceil((pd.Timestamp(debut) - journalier['debut']) / jour)
+    j = math.floor((pd.Timestamp(fin) - journalier['debut']) / jour) + 1
+    return min(max(i, 0), nb_jours), min(max(j, 0), nb_jours)
+
+def ca_periode(journalier, debut, fin):
+    """CA total entre deux dates incluses"""
+    i, j = bornes_periode(journalier, debut, fin)
+    return journalier['cumul_ca'][j] - journalier['cumul_ca'][i] if j > i else 0.0
+
+def jours_travailles_periode(journalier, debut, fin):
+    """Nombre de jours travaillés (lignes avec CA) entre deux dates incluses"""
+    i, j = bornes_periode(journalier, debut, fin)
+    return int(journalier['cumul_lignes'][j] - journalier['cumul_lignes'][i]) if j > i else 0
+
+def valeurs_des_jours(journalier, dates):
+    """CA et nombre de collaborateurs de plusieurs journées (0 si aucune donnée), lus en un accès vectorisé"""
+    positions = ((dates - journalier['debut']) // pd.Timedelta(days=1)).to_numpy()
+    connues = (positions >= 0) & (positions < len(journalier['ca']))
+    
+    ca = np.zeros(len(dates))
+    nb_collaborateurs = np.zeros(len(dates), dtype=int)
+    ca[connues] = journalier['ca'][positions[connues]]
+    nb_collaborateurs[connues] = journalier['nb_collaborateurs'][positions[connues]]
+    return ca, nb_collaborateurs
+
+def construire_alignement_n_moins_1(dates):
+    """Table d'alignement N → N-1 : pour chaque date, la journée comparable un an plus tôt.
+    
+    Règle : on part de la même date un an plus tôt (le 29 février donne le
+    28 février), puis on prend le même jour de la semaine le plus proche, au
+    plus 3 jours avant ou après (il est unique). 'comparable_mois' garde ce
+    jour s'il tombe dans le même mois, sinon la même date un an plus tôt :
+    c'est la borne des cumuls de mois à date.
+    """
+    dates = pd.DatetimeIndex(dates)
+    reference = dates - pd.DateOffset(years=1)
+    ecart = (dates.dayofweek - reference.dayofweek) % 7
+    comparable = reference + pd.to_timedelta(np.where(ecart <= 3, ecart, ecart - 7), unit='D')
+    return pd.DataFrame({
+        'reference': reference,
+        'comparable': comparable,
+        'comparable_mois': comparable.where(comparable.month == reference.month, reference)
+    }, index=dates)
+
+@st.cache_resource(max_entries=4)
+def table_alignement_n_moins_1(annee_debut, annee_fin):
+    """Table d'alignement des années annee_debut à annee_fin incluses.
+    
+    Elle ne dépend que du calendrier : une saisie qui ne change pas les
+    années couvertes garde la même table.
+    """
+    return construire_alignement_n_moins_1(pd.date_range(f"{annee_debut}-01-01", f"{annee_fin}-12-31", freq='D'))
+
+def dates_n_moins_1(donnees, dates, meme_mois=False):
+    """Journées N-1 comparables à des dates, lues dans la table d'alignement du calendrier des données"""
+    dates = pd.DatetimeIndex(dates).normalize()
+    journalier = donnees['journalier']
+    # Tout le calendrier des données et l'année suivante
+    annee_debut = journalier['debut'].year
+    annee_fin = max((journalier['debut'] + pd.Timedelta(days=len(journalier['ca']))).year, datetime.now().year) + 1
+    table = table_alignement_n_moins_1(annee_debut, annee_fin)
+    if not dates.isin(table.index).all():
+        table = construire_alignement_n_moins_1(dates)  # Dates hors calendrier : même règle, calcul direct
+    return pd.DatetimeIndex(table.loc[dates, 'comparable_mois' if meme_mois else 'comparable'])
+
+def tableau_suivi(donnees, annee, mois):
+    """Tableau jour par jour d'un mois N face aux journées comparables de N-1 (page Suivi)"""
+    journalier = donnees['journalier']
+    dates_n = pd.date_range(datetime(annee, mois, 1), periods=calendar.monthrange(annee, mois)[1], freq='D')
+    dates_comparables = dates_n_moins_1(donnees, dates_n)
+    ca_n, nb_n = valeurs_des_jours(journalier, dates_n)
+    ca_n_moins_1, nb_n_moins_1 = valeurs_des_jours(journalier, dates_comparables)
+    
+    return pd.DataFrame({
+        'Jour': np.array(JOURS_SEMAINE_FR)[dates_n.dayofweek],
+        'Date N-1': dates_comparables.strftime('%d/%m/%Y'),
+        'Date N': dates_n.strftime('%d/%m/%Y'),
+        'Montant N-1': pd.Series(ca_n_moins_1).map(formater_euro).where(ca_n_moins_1 > 0, '-'),
+        'Nb Collab N-1': np.where(ca_n_moins_1 > 0, nb_n_moins_1.astype(str), '-'),
+        'Montant N': pd.Series(ca_n).map(formater_euro).where(ca_n > 0, '-'),
+        'Nb Collab N': np.where(ca_n > 0, nb_n.astype(str), '-')
+    })
+
+def construire_cube(df):
+    """Pré-agrège le CA par exercice × mois × jour de la semaine, en un seul groupby"""
+    # Sommes en float64 / int64 : les types compacts du DataFrame déborderaient
+    df = df.assign(montant=montants_euros(df), nb_collaborateurs=df['nb_collaborateurs'].astype('int64'))
+    return df.groupby(['exercice', 'mois', 'jour_semaine'], observed=True).agg(
+        ca=('montant', 'sum'),
+        nb_jours=('montant', 'count'),
+        total_collaborateurs=('nb_collaborateurs', 'sum')
+    )
+
+def stats_par_exercice(cube):
+    """Totaux par exercice : CA, jours travaillés et moyenne de collaborateurs"""
+    stats = cube.groupby(level='exercice', observed=True).sum()
+    stats['moyenne_collaborateurs'] = (stats['total_collaborateurs'] / stats['nb_jours']).fillna(0)
+    return stats
+
+def tableau_cube(cube, niveau, mesure='ca'):
+    """Tableau exercice × niveau du cube ('mois' ou 'jour_semaine') pour une mesure"""
+    tableau = cube[mesure].groupby(level=['exercice', niveau], observed=True).sum().unstack(niveau)
+    colonnes = list(range(1, 13)) if niveau == 'mois' else JOURS_SEMAINE
+    return tableau.reindex(columns=colonnes).fillna(0)
+
+# Mois de l'exercice fiscal, de juillet à juin
+MOIS_EXERCICE = {
+    7: 'Juillet', 8: 'Août', 9: 'Septembre', 10: 'Octobre', 11: 'Novembre', 12: 'Décembre',
+    1: 'Janvier', 2: 'Février', 3: 'Mars', 4: 'Avril', 5: 'Mai', 6: 'Juin'
+}
+
+@st.cache_resource(max_entries=64)
+def montants_mensuels_exercice(exercice, version_exercice, _cube):
+    """Montants des 12 mois d'un exercice, calculés une fois par version de l'exercice"""
+    montants = _cube['ca'].xs(exercice, level='exercice').groupby(level='mois').sum()
+    return montants.reindex(list(MOIS_EXERCICE), fill_value=0).round(2)  # Sommes de centimes
+
+def tableau_montants_mensuels(donnees, premier_exercice='2019/2020'):
+    """Montants mensuels par exercice avec colonne Total et ligne Moyenne.
+    
+    Chaque ligne est gardée par version de son exercice : une saisie ne fait
+    recalculer que l'exercice qu'elle touche.
+    """
+    cube = donnees['cube']
+    exercices = [
+        exercice for exercice in cube.index.get_level_values('exercice').unique().astype(str).sort_values()
+        if exercice >= premier_exercice
+    ]
+    tableau = pd.DataFrame(
+        [montants_mensuels_exercice(exercice, donnees['versions_exercice'].get(exercice, donnees['version']), cube)
+         for exercice in exercices],
+        index=exercices, columns=list(MOIS_EXERCICE)
+    ).rename(columns=MOIS_EXERCICE)
+    tableau['Total'] = tableau.sum(axis=1).round(2)
+    tableau.loc['Moyenne'] = tableau.mean()
+    return tableau.rename_axis('Exercice').reset_index()
+
+def appliquer_deltas_journalier(journalier, deltas):
+    """CA journalier mis à jour pour des journées modifiées, sans tout recalculer.
+    
+    deltas : liste de (date, ancien, nouveau), ancien et nouveau valant
+    (montant, nb_collaborateurs) ou None si la journée n'a pas de ligne.
+    Chaque journée se met à jour en place ; les cumuls reçoivent l'écart
+    en une addition vectorisée sur les jours suivants.
+    """
+    jour = pd.Timedelta(days=1)
+    debut = journalier['debut']
+    ca, nb_collaborateurs = journalier['ca'].copy(), journalier['nb_collaborateurs'].copy()
+    cumul_ca, cumul_lignes = journalier['cumul_ca'].copy(), journalier['cumul_lignes'].copy()
+    
+    for date, ancien, nouveau in deltas:
+        position = (date - debut) // jour
+        
+        # Journée hors du calendrier : on l'étend (jours vides)
+        if position < 0:
+            ca = np.concatenate((np.zeros(-position), ca))
+            nb_collaborateurs = np.concatenate((np.zeros(-position, dtype=nb_collaborateurs.dtype), nb_collaborateurs))
+            cumul_ca = np.concatenate((np.zeros(-position), cumul_ca))
+            cumul_lignes = np.concatenate((np.zeros(-position, dtype=cumul_lignes.dtype), cumul_lignes))
+            debut, position = date, 0
+        elif position >= len(ca):
+            ajout = position - len(ca) + 1
+            ca = np.concatenate((ca, np.zeros(ajout)))
+            nb_collaborateurs = np.concatenate((nb_collaborateurs, np.zeros(ajout, dtype=nb_collaborateurs.dtype)))
+            cumul_ca = np.concatenate((cumul_ca, np.full(ajout, cumul_ca[-1])))
+            cumul_lignes = np.concatenate((cumul_lignes, np.full(ajout, cumul_lignes[-1])))
+        
+        montant, nb = nouveau or (0.0, 0)
+        ecart_ca = montant - ca[position]
+        ca[position] = montant
+        nb_collaborateurs[position] = nb
+        cumul_ca[position + 1:] += ecart_ca
+        cumul_lignes[position + 1:] += (nouveau is not None) - (ancien is not None)
+    
+    # Calendrier resserré sur les jours avec données, comme un calcul complet
+    remplis = np.flatnonzero(np.diff(cumul_lignes))
+    i, j = (remplis[0], remplis[-1] + 1) if remplis.size else (0, 0)
+    return {
+        'debut': debut + i * jour,
+        'ca': ca[i:j],
+        'nb_collaborateurs': nb_collaborateurs[i:j],
+        'cumul_ca': cumul_ca[i:j + 1] - cumul_ca[i],
+        'cumul_lignes': cumul_lignes[i:j + 1] - cumul_lignes[i]
+    }
+
+def appliquer_deltas_cube(cube, deltas):
+    """Cube mis à jour cellule par cellule pour des journées modifiées (mêmes deltas que le journalier)"""
+    types = cube.dtypes
+    cube = cube.copy()
+    nouvelle_cellule = False
+    
+    for date, ancien, nouveau in deltas:
+        (montant_avant, nb_avant), (montant, nb) = ancien or (0.0, 0), nouveau or (0.0, 0)
+        ecarts = {
+            'ca': montant - montant_avant,
+            'nb_jours': (nouveau is not None) - (ancien is not None),
+            'total_collaborateurs': nb - nb_avant
+        }
+        cle = (calculer_exercice(date), date.month, JOURS_SEMAINE[date.dayofweek])
+        if cle in cube.index:
+            for colonne, ecart in ecarts.items():
+                cube.loc[cle, colonne] += ecart
+        else:
+            cube.loc[cle, list(ecarts)] = list(ecarts.values())
+            nouvelle_cellule = True
+    
+    # Les cellules sans jour disparaissent, comme dans un calcul complet
+    cube = cube[cube['nb_jours'] > 0].astype(types)
+    
+    # Niveaux d'index comme dans un calcul complet : exercices présents, mois int8, jours catégoriels
+    niveaux = cube.index.to_frame(index=False).astype({'exercice': 'str'})
+    cube.index = pd.MultiIndex.from_frame(niveaux.astype({
+        'exercice': 'category',
+        'mois': 'int8',
+        'jour_semaine': pd.CategoricalDtype(JOURS_SEMAINE)
+    }))
+    return cube.sort_index() if nouvelle_cellule else cube
+
+def figer_donnees(donnees):
+    """Rend des données préparées partageables en lecture seule entre sessions.
+    
+    Dictionnaires en lecture seule et tableaux numpy non modifiables. Les
+    DataFrames sont protégés par le copy-on-write, toujours actif depuis
+    pandas 3.0 (version minimale de requirements.txt) : une sélection ou une
+    tranche modifiée par une page est copiée à ce moment-là, sans toucher aux
+    données partagées. Seul l'ajout d'une colonne au DataFrame partagé
+    lui-même le modifierait : toute colonne dérivée se calcule ici.
+    La taille mémoire est mesurée ici aussi, une fois par version.
+    """
+    for tableau in donnees['journalier'].values():
+        if isinstance(tableau, np.ndarray):
+            tableau.flags.writeable = False
+    return MappingProxyType({
+        **donnees,
+        'journalier': MappingProxyType(donnees['journalier']),
+        'versions_exercice': MappingProxyType(donnees['versions_exercice']),
+        'taille': taille_donnees(donnees)
+    })
+
+def preparer_donnees(df, version):
+    """Prépare les données nettoyées pour les pages (colonnes, index, agrégats), en lecture seule"""
+    df = indexer_par_date(ajouter_colonnes_calculees(df))
+    return figer_donnees({
+        'version': version,
+        'df': df,
+        'journalier': construire_ca_journalier(df),
+        'cube': construire_cube(df),
+        # Version par exercice : un calcul limité à un exercice n'est à refaire
+        # que si une saisie a touché cet exercice
+        'versions_exercice': dict.fromkeys(df['exercice'].cat.categories, version)
+    })
+
+def taille_donnees(donnees):
+    """Mémoire occupée par des données préparées (DataFrame, CA journalier et cube), en octets"""
+    if not donnees:
+        return 0
+    return int(
+        donnees['df'].memory_usage(deep=True).sum()
+        + sum(valeur.nbytes for valeur in donnees['journalier'].values() if isinstance(valeur, np.ndarray))
+        + donnees['cube'].memory_usage(deep=True).sum()
+    )
+
+def taille_lignes_brutes(valeurs):
+    """Estimation de la mémoire occupée par les lignes brutes du sheet, en octets"""
+    return sys.getsizeof(valeurs) + sum(
+        sys.getsizeof(ligne) + sum(map(sys.getsizeof, ligne)) for ligne in valeurs
+    )
+
+def formater_octets(octets):
+    """Formate une taille mémoire en Mo"""
+    return f"{octets / 1024 ** 2:.1f} Mo".replace(".", ",")
+
+def mettre_a_jour_instantane(etat):
+    """Réécrit l'instantané local si les données préparées ont changé depuis"""
+    donnees = etat['donnees']
+    if donnees is not None and donnees['version'] != etat['version_instantane']:
+        try:
+            sauvegarder_instantane(donnees['df'], donnees['version'])
+        except (OSError, sqlite3.Error):
+            pass  # L'instantané n'est qu'une accélération, on continue sans
+
+def nettoyer_valeurs(valeurs):
+    """Transforme les lignes brutes du sheet en DataFrame propre (date, montant, nb_collaborateurs).
+    
+    Retourne (df, rapport) ; lève ValueError si le sheet est vide ou mal structuré.
+    """
+    if not valeurs or len(valeurs) < 2:
+        raise ValueError("Aucune donnée trouvée dans le stockage")
+    
+    # La première ligne contient les en-têtes, les autres sont les données
+    headers = valeurs[0]
+    data_rows = valeurs[1:]
+    
+    # Colonnes attendues : A=Clé, B=Année, C=Date, D=Jour, E=Mois, F=Valeur, G=Nb_Collaborateurs
+    if len(headers) < NB_COLONNES:
+        raise ValueError(f"Structure du sheet incorrecte. Colonnes trouvées : {len(headers)}")
+    
+    # Créer le DataFrame manuellement
+    df = pd.DataFrame(data_rows, columns=headers[:NB_COLONNES])
+    
+    # Compter les lignes initiales
+    nb_lignes_initiales = len(df)
+    
+    # Traiter les colonnes par index pour éviter les problèmes de noms (même avec doublons)
+    df['date'], nb_dates_repli = convertir_dates(df.iloc[:, 2])  # Colonne C (index 2)
+    
+    # Nettoyage vectorisé des montants (colonne F = index 5)
+    df['montant'], nb_montants_rejetes = convertir_montants(df.iloc[:, 5])
+    collaborateurs = pd.to_numeric(df.iloc[:, 6], errors='coerce').fillna(0)  # Colonne G (index 6)
+    collaborateurs_corriges = collaborateurs.clip(0, NB_COLLABORATEURS_MAX).round()
+    nb_collaborateurs_corriges = int((collaborateurs_corriges != collaborateurs).sum())
+    df['nb_collaborateurs'] = collaborateurs_corriges
+    
+    # Compter combien de lignes sont perdues
+    nb_dates_invalides = df['date'].isna().sum()
+    
+    # Filtrer uniquement les lignes où date ET montant sont valides
+    df = df.dropna(subset=['date'])
+    df = df[df['montant'] > 0]  # On garde seulement les montants > 0
+    nb_lignes_finales = len(df)
+    
+    rapport = {
+        'lignes': nb_lignes_initiales,
+        'lignes_retenues': nb_lignes_finales,
+        'dates_invalides': int(nb_dates_invalides),
+        'dates_repli': nb_dates_repli,
+        'montants_rejetes': nb_montants_rejetes,
+        'collaborateurs_corriges': nb_collaborateurs_corriges
+    }
+    
+    # Sélectionner seulement les colonnes nécessaires, en types compacts
+    return df[['date', 'montant', 'nb_collaborateurs']].astype(TYPES_DONNEES), rapport
+
+def charger_donnees():
+    """Données préparées (DataFrame, CA journalier, cube et version), communes à toutes les sessions.
+    
+    Chaque réexécution reçoit le même objet en lecture seule, identifié par sa
+    version : ni copie ni désérialisation par session. Le contrôle et la
+    synchronisation avec Google Sheets se font en arrière-plan quand ils sont
+    dus ; seul un tout premier chargement sans instantané local attend le réseau.
+    """
+    etat = get_etat_synchro()
+    controle_du = time.time() >= etat['prochaine_verification']
+    
+    if etat['donnees'] is not None:
+        if controle_du:
+            lancer_rafraichissement()
+        return etat['donnees']
+    
+    # Démarrage à froid : instantané local préparé une fois pour toutes les sessions,
+    # la synchronisation avec Google Sheets se fait en arrière-plan
+    donnees_instantane = etat['donnees_instantane']
+    if donnees_instantane is None and not etat['valeurs']:
+        df_instantane = charger_instantane()
+        if df_instantane is not None:
+            donnees_instantane = preparer_donnees(df_instantane, etat['version_instantane'])
+            etat['donnees_instantane'] = donnees_instantane
+    if donnees_instantane is not None:
+        if controle_du:
+            lancer_rafraichissement()
+        if etat['erreur_rafraichissement']:
+            st.warning(f"⚠️ Stockage des données injoignable, affichage de l'instantané local : {etat['erreur_rafraichissement']}")
+        return donnees_instantane
+    
+    # Rien de préparé (premier chargement) : nouvel essai à l'intervalle de contrôle
+    if controle_du and not lancer_rafraichissement(attendre=True):
+        st.error("❌ Chargement des données trop long, nouvel essai au prochain affichage")
+        return None
+    if etat['donnees'] is None:
+        st.error(f"❌ Erreur lors du chargement : {etat['erreur_rafraichissement']}")
         return None
+    return etat['donnees']
+
+def reporter_changements(donnees, changements, version):
+    """Reporte des saisies sur des données préparées, par deltas sur les agrégats.
+    
+    changements : {date: (montant, nb_collaborateurs)}, un montant à 0 supprime la date.
+    Retourne de nouvelles données en lecture seule à la version indiquée, ou
+    None si une date touchée est en double (les données sont alors à reconstruire).
+    """
+    df = donnees['df']
+    touchees = np.zeros(len(df), dtype=bool)
+    for date in changements:
+        i, j = bornes_dates(df, date, date)
+        touchees[i:j] = True
+    if df.index[touchees].duplicated().any():
+        return None
+    
+    nouvelles = pd.DataFrame(
+        [(date, montant, nb) for date, (montant, nb) in changements.items() if montant > 0],
+        columns=['date', 'montant', 'nb_collaborateurs']
+    ).astype(df[['date', 'montant', 'nb_collaborateurs']].dtypes.to_dict())
+    nouvelles = indexer_par_date(ajouter_colonnes_calculees(nouvelles))
+    
+    # Mêmes catégories d'exercice des deux côtés pour garder une colonne catégorielle
+    exercices = df['exercice'].cat.categories
+    exercices = exercices.union(nouvelles['exercice'].cat.categories).astype(exercices.dtype)
+    df = df[~touchees].astype({'exercice': pd.CategoricalDtype(exercices)})
+    nouvelles = nouvelles.astype({'exercice': pd.CategoricalDtype(exercices)})
+    df = pd.concat([df, nouvelles]).sort_index(kind='stable')
+    df['exercice'] = df['exercice'].cat.remove_unused_categories()
+    
+    # Deltas des journées touchées pour les agrégats, sans rien réagréger
+    anciennes = donnees['df'].loc[touchees]
+    anciennes = dict(zip(anciennes.index, zip(montants_euros(anciennes), anciennes['nb_collaborateurs'])))
+    saisies = dict(zip(nouvelles.index, zip(montants_euros(nouvelles), nouvelles['nb_collaborateurs'])))
+    deltas = [(date, anciennes.get(date), saisies.get(date)) for date in changements]
+    
+    exercices_touches = {calculer_exercice(date) for date in changements}
+    return figer_donnees({
+        'version': version,
+        'df': df,
+        'journalier': appliquer_deltas_journalier(donnees['journalier'], deltas) if len(df) else construire_ca_journalier(df),
+        'cube': appliquer_deltas_cube(donnees['cube'], deltas),
+        'versions_exercice': {
+            **dict.fromkeys(exercices, version),
+            **donnees['versions_exercice'],
+            **dict.fromkeys(exercices_touches, version)
+        }
+    })
+
+def patcher_donnees(changements, version_avant, version_apres):
+    """Reporte des saisies enregistrées sur les données préparées, sans relire ni reparser le sheet.
+    
+    changements : {date: (montant, nb_collaborateurs)}, un montant à 0 supprime la date.
+    Seules les données préparées à partir de version_avant sont mises à jour, et
+    seulement si les lignes brutes en sont toujours à version_apres (celle des
+    saisies reportées) ; sinon (retour False) le prochain rafraîchissement les
+    reconstruit entièrement.
+    """
+    etat = get_etat_synchro()
+    
+    with etat['verrou']:
+        donnees = etat['donnees']
+        if donnees is None or donnees['version'] != version_avant or etat['version'] != version_apres:
+            return False
+        
+        donnees = reporter_changements(donnees, changements, version_apres)
+        if donnees is None:
+            return False  # Date en double dans le sheet : les données seront reconstruites
+        
+        etat['donnees'] = donnees
+        etat['taille_lignes_brutes'] = taille_lignes_brutes(etat['valeurs'])
+        if etat['rapport']:
+            etat['rapport'] = {**etat['rapport'], 'lignes': len(etat['valeurs']) - 1, 'lignes_retenues': len(donnees['df'])}
+        return True
 
 def calculer_exercice(date):
     """Calcule l'exercice fiscal (juillet à juin)"""
@@ -448,7 +1596,7 @@ def generer_pdf_suivi(donnees_tableau, mois_selectionne, annee_mois_n, annee_moi
     buffer.seek(0)
     return buffer
 
-def generer_pdf_historique(df, exercices):
+def generer_pdf_historique(cube, exercices):
     """Génère un PDF complet de la page Historique avec chaque tableau sur une page séparée"""
     buffer = BytesIO()
     
@@ -513,14 +1661,12 @@ def generer_pdf_historique(df, exercices):
     
     # Préparer les données
     stats_data = [['Exercice', 'CA Total', 'Jours\nTravaillés', 'Moy.\nCollab.', 'CA Moyen\nMensuel', 'CA Moyen\nJournalier']]
+    stats = stats_par_exercice(cube)
     
     for exercice in exercices:
-        df_exercice = df[df['exercice'] == exercice]
-        ca_total = df_exercice['montant'].sum()
-        
-        df_avec_ca = df_exercice[df_exercice['montant'] > 0]
-        nb_jours_travailles = len(df_avec_ca)
-        moyenne_collab = df_avec_ca['nb_collaborateurs'].mean() if len(df_avec_ca) > 0 else 0
+        ca_total = stats.loc[exercice, 'ca']
+        nb_jours_travailles = int(stats.loc[exercice, 'nb_jours'])
+        moyenne_collab = stats.loc[exercice, 'moyenne_collaborateurs']
         
         ca_moyen_jour = ca_total / nb_jours_travailles if nb_jours_travailles > 0 else 0
         ca_moyen_mois = ca_total / 12
@@ -590,23 +1736,20 @@ def generer_pdf_historique(df, exercices):
     monthly_data = [['Mois'] + exercices_filtre]
     
     # Chaque ligne = un mois
+    ca_mensuel = tableau_cube(cube, 'mois')
     for mois_nom in mois_ordre:
         row = [mois_nom]
         mois_num = mois_mapping[mois_nom]
         
         for exercice in exercices_filtre:
-            df_ex = df[df['exercice'] == exercice]
-            montant = df_ex[df_ex['mois'] == mois_num]['montant'].sum()
-            row.append(formater_euro(montant))
+            row.append(formater_euro(ca_mensuel.loc[exercice, mois_num]))
         
         monthly_data.append(row)
     
     # Ligne Total
     row_total = ['TOTAL']
     for exercice in exercices_filtre:
-        df_ex = df[df['exercice'] == exercice]
-        total = df_ex['montant'].sum()
-        row_total.append(formater_euro(total))
+        row_total.append(formater_euro(stats.loc[exercice, 'ca']))
     monthly_data.append(row_total)
     
     # Calculer les largeurs de colonnes dynamiquement
@@ -685,24 +1828,14 @@ def generer_pdf_historique(df, exercices):
     elements.append(Paragraph("📅 Comparatif par Jour de la Semaine", subtitle_style))
     elements.append(Spacer(1, 0.3*cm))
     
-    # Mapping des jours
-    jours_en_fr = {
-        'Monday': 'Lundi', 'Tuesday': 'Mardi', 'Wednesday': 'Mercredi',
-        'Thursday': 'Jeudi', 'Friday': 'Vendredi', 'Saturday': 'Samedi', 'Sunday': 'Dimanche'
-    }
-    df['jour_semaine_fr'] = df['jour_semaine'].map(jours_en_fr)
-    jours_ordre = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
-    
     # Préparer les données
     comparatif_data = [['Jour'] + list(exercices)]
+    ca_jours = tableau_cube(cube, 'jour_semaine')
     
-    for jour in jours_ordre:
-        row = [jour]
+    for jour, jour_fr in zip(JOURS_SEMAINE, JOURS_SEMAINE_FR):
+        row = [jour_fr]
         for exercice in exercices:
-            df_exercice = df[df['exercice'] == exercice]
-            df_jour = df_exercice[df_exercice['jour_semaine_fr'] == jour]
-            ca_jour = df_jour['montant'].sum()
-            row.append(formater_euro(ca_jour))
+            row.append(formater_euro(ca_jours.loc[exercice, jour]))
         comparatif_data.append(row)
     
     # Créer le tableau comparatif
@@ -739,90 +1872,396 @@ def generer_pdf_historique(df, exercices):
     buffer.seek(0)
     return buffer
 
-def enregistrer_transaction(date_saisie, montant, nb_collaborateurs):
-    """Enregistre une nouvelle transaction dans Google Sheets"""
+# ==================== INDEX DES LIGNES DU SHEET ====================
+
+def construire_index_lignes(valeurs):
+    """Associe chaque date du sheet au numéro de sa première ligne"""
+    dates, _ = convertir_dates(pd.Series([ligne[2] for ligne in valeurs[1:]], dtype=object))
+    valides = dates.notna().to_numpy()
+    numeros = pd.Series(np.arange(2, len(valeurs) + 1)[valides], index=dates[valides].dt.date)
+    return numeros[~numeros.index.duplicated()].to_dict()
+
+def index_lignes():
+    """Index date → ligne des lignes brutes en mémoire (reconstruit si elles ont changé).
+    
+    Retourne (index, version, nombre de lignes), lus ensemble sous le verrou :
+    la version est celle des lignes dont l'index est tiré.
+    """
+    etat = get_etat_synchro()
+    
+    with etat['verrou']:
+        if etat['version_index'] != etat['version']:
+            etat['index_lignes'] = construire_index_lignes(etat['valeurs']) if etat['valeurs'] else {}
+            etat['version_index'] = etat['version']
+        return etat['index_lignes'], etat['version'], len(etat['valeurs'])
+
+def recharger_lignes():
+    """Recharge entièrement les lignes brutes par le rafraîchissement en arrière-plan.
+    
+    Passer par ce thread garde un seul téléchargement du sheet à la fois,
+    même si un envoi du journal et un rafraîchissement tombent ensemble.
+    """
+    etat = get_etat_synchro()
+    forcer_rechargement_complet()
+    # Deux essais : un rafraîchissement déjà en cours a pu synchroniser avant la demande
+    for _ in range(2):
+        if not lancer_rafraichissement(attendre=True):
+            raise TimeoutError("Rechargement du sheet trop long, nouvel essai plus tard")
+        if etat['dernier_complet']:
+            return
+    raise ConnectionError(etat['erreur_rafraichissement'] or "Rechargement du sheet impossible")
+
+def trouver_lignes(stockage, dates):
+    """Numéros des lignes du sheet qui contiennent les dates (absentes du résultat si inexistantes).
+    
+    Retourne (lignes, version des lignes brutes sur lesquelles elles ont été trouvées).
+    
+    Les lignes données par l'index sont contrôlées en relisant leurs seules
+    cellules Date, avec la fin du sheet après les lignes connues, en une
+    requête. Le sheet n'est retéléchargé en entier que si ce contrôle échoue
+    (ligne modifiée ou ajoutée hors de l'application).
+    """
+    if not get_etat_synchro()['valeurs']:
+        recharger_lignes()  # Pages servies depuis l'instantané : lignes pas encore chargées
+    
+    index, version, nb_lignes = index_lignes()
+    lignes = {date: index[date] for date in dates if date in index}
+    fin_sheet, *cellules = stockage.lire_plusieurs(
+        [f"A{nb_lignes + 1}:G"] + [f"C{ligne}" for ligne in lignes.values()]
+    )
+    intact = not fin_sheet
+    if intact and lignes:
+        valeurs = [cellule[0][0] if cellule and cellule[0] else '' for cellule in cellules]
+        dates_lues, _ = convertir_dates(pd.Series(valeurs, dtype=object))
+        intact = list(dates_lues.dt.date) == list(lignes)
+    if intact:
+        return lignes, version
+    
+    # L'index ne correspond plus au sheet : on recharge tout
+    recharger_lignes()
+    index, version, _ = index_lignes()
+    return {date: index[date] for date in dates if date in index}, version
+
+def appliquer_ecritures_locales(version_avant, mises_a_jour=(), suppressions=(), ajouts=()):
+    """Reporte dans les lignes brutes en mémoire les écritures faites dans le sheet.
+    
+    Évite de retélécharger le sheet après un enregistrement ; l'index
+    date → ligne suit automatiquement puisqu'il est dérivé de ces lignes.
+    version_avant : version des lignes sur lesquelles les numéros de ligne ont
+    été calculés. Si elles ont changé depuis (synchronisation concurrente),
+    rien n'est reporté et le prochain rafraîchissement recharge tout.
+    Retourne la nouvelle version des lignes, ou None.
+    """
+    etat = get_etat_synchro()
+    
+    with etat['verrou']:
+        if not etat['valeurs'] or etat['version'] != version_avant:
+            etat['dernier_complet'] = 0.0  # Lignes inconnues ou changées : rechargement complet
+            return None
+        
+        # Les ajouts sont écrits juste après la dernière ligne remplie ; si quelqu'un
+        # a écrit entre-temps, la fenêtre de contrôle de la synchro le détectera
+        premiere_ligne_ajout = len(etat['valeurs']) - len(suppressions) + 1
+        valeurs = list(etat['valeurs'])
+        for ligne, montant, nb_collaborateurs in mises_a_jour:
+            nouvelle = list(valeurs[ligne - 1])
+            nouvelle[5], nouvelle[6] = montant, nb_collaborateurs
+            valeurs[ligne - 1] = normaliser_ligne(nouvelle)
+        for ligne in sorted(suppressions, reverse=True):
+            del valeurs[ligne - 1]
+        if ajouts:
+            # Lignes vides éventuelles entre la fin connue du sheet et les ajouts
+            valeurs.extend([[''] * NB_COLONNES] * max(0, premiere_ligne_ajout - len(valeurs) - 1))
+            valeurs.extend(normaliser_ligne(ligne) for ligne in ajouts)
+        
+        etat['valeurs'] = valeurs
+        etat['version'] = empreinte_lignes(valeurs)
+        return etat['version']
+
+def ligne_transaction(date_saisie, montant, nb_collaborateurs):
+    """Ligne A à G d'une nouvelle transaction"""
+    # Noms des jours et mois en français
+    jours_fr = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+    mois_fr = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 
+               'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
+    
+    return [
+        f"{date_saisie.year}|{date_saisie.strftime('%Y-%m-%d')}",          # Clé (A)
+        date_saisie.year,                                                  # Année (B)
+        f"{date_saisie.day}/{date_saisie.month}/{date_saisie.year}",       # Date au format Google Sheets : d/m/yyyy (C)
+        jours_fr[date_saisie.weekday()],                                   # Jour (D)
+        mois_fr[date_saisie.month - 1],                                    # Mois (E)
+        montant,                                                           # Valeur (F)
+        nb_collaborateurs                                                  # Nb_Collaborateurs (G)
+    ]
+
+def enregistrer_transactions(entrees):
+    """Enregistre plusieurs transactions dans Google Sheets en une seule requête.
+    
+    entrees : liste de (date, montant, nb_collaborateurs) ; pour une même date,
+    la dernière entrée l'emporte. Un montant à 0 supprime la date.
+    Retourne (succès, liste des messages).
+    """
     try:
-        client = get_gsheet_client()
-        if not client:
-            return False, "❌ Impossible de se connecter à Google Sheets"
-        
-        # Ouvrir le spreadsheet
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        worksheet = spreadsheet.worksheet(SHEET_NAME)
-        
-        # Préparer les données
-        annee = date_saisie.year
-        # Format pour Google Sheets : d/m/yyyy (sans zéros de tête)
-        date_str_sheets = f"{date_saisie.day}/{date_saisie.month}/{date_saisie.year}"
-        cle = f"{annee}|{date_saisie.strftime('%Y-%m-%d')}"
-        
-        # Noms des jours et mois en français
-        jours_fr = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
-        mois_fr = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 
-                   'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
-        
-        jour_semaine = jours_fr[date_saisie.weekday()]
-        mois_nom = mois_fr[date_saisie.month - 1]
-        
-        # Récupérer toutes les données pour trouver si la date existe
-        all_data = worksheet.get_all_values()
-        
-        # Trouver la ligne correspondante (chercher dans la colonne Date - colonne C = index 2)
-        ligne_existante = None
-        for idx, row in enumerate(all_data[1:], start=2):  # Commencer à la ligne 2 (après l'en-tête)
-            if len(row) > 2:
-                # Comparer les dates en les parsant (pour gérer tous les formats)
-                date_row = row[2]
-                try:
-                    # Parser la date du sheet
-                    date_parsed = pd.to_datetime(date_row, dayfirst=True).date()
-                    if date_parsed == date_saisie.date():
-                        ligne_existante = idx
-                        break
-                except:
-                    continue
-        
-        if ligne_existante:
-            if montant == 0:
-                # SUPPRESSION : Montant = 0
-                worksheet.delete_rows(ligne_existante)
-                message = f"🗑️ Transaction SUPPRIMÉE pour le {date_saisie.strftime('%d/%m/%Y')}"
-            else:
-                # MISE À JOUR : La date existe déjà
-                worksheet.update_cell(ligne_existante, 6, montant)  # Colonne F = Valeur
-                worksheet.update_cell(ligne_existante, 7, nb_collaborateurs)  # Colonne G = Nb_Collaborateurs
-                message = f"✅ Transaction MISE À JOUR : {formater_euro(montant)} le {date_saisie.strftime('%d/%m/%Y')} ({nb_collaborateurs} collaborateur{'s' if nb_collaborateurs > 1 else ''})"
-        else:
-            if montant == 0:
+        stockage = ouvrir_stockage()
+        if stockage is None:
+            return False, ["❌ Impossible d'ouvrir le stockage des données"]
+        
+        entrees = {pd.Timestamp(date_saisie).normalize(): (montant, nb_collaborateurs)
+                   for date_saisie, montant, nb_collaborateurs in entrees}
+        # Numéros de ligne et version des lignes sur lesquelles ils ont été trouvés
+        lignes, version_avant = trouver_lignes(stockage, [date_saisie.date() for date_saisie in entrees])
+        etat = get_etat_synchro()
+        
+        mises_a_jour, suppressions, ajouts, messages = [], [], [], []
+        changements = {}
+        for date_saisie, (montant, nb_collaborateurs) in entrees.items():
+            ligne_existante = lignes.get(date_saisie.date())
+            date_affichee = date_saisie.strftime('%d/%m/%Y')
+            collaborateurs = f"{nb_collaborateurs} collaborateur{'s' if nb_collaborateurs > 1 else ''}"
+            
+            if ligne_existante:
+                if montant == 0:
+                    # SUPPRESSION : Montant = 0
+                    suppressions.append(ligne_existante)
+                    changements[date_saisie] = (0, nb_collaborateurs)
+                    messages.append(f"🗑️ Transaction SUPPRIMÉE pour le {date_affichee}")
+                else:
+                    # MISE À JOUR : La date existe déjà
+                    mises_a_jour.append((ligne_existante, montant, nb_collaborateurs))
+                    changements[date_saisie] = (montant, nb_collaborateurs)
+                    messages.append(f"✅ Transaction MISE À JOUR : {formater_euro(montant)} le {date_affichee} ({collaborateurs})")
+            elif montant == 0:
                 # Pas de création si montant = 0 et date inexistante
-                message = f"ℹ️ Aucune donnée à supprimer pour le {date_saisie.strftime('%d/%m/%Y')}"
+                messages.append(f"ℹ️ Aucune donnée à supprimer pour le {date_affichee}")
             else:
                 # AJOUT : Nouvelle date
-                nouvelle_ligne = [
-                    cle,                  # Clé (A)
-                    annee,                # Année (B)
-                    date_str_sheets,      # Date au format Google Sheets : d/m/yyyy (C)
-                    jour_semaine,         # Jour (D)
-                    mois_nom,             # Mois (E)
-                    montant,              # Valeur (F)
-                    nb_collaborateurs     # Nb_Collaborateurs (G)
-                ]
-                
-                worksheet.append_row(nouvelle_ligne)
-                message = f"✅ Transaction AJOUTÉE : {formater_euro(montant)} le {date_saisie.strftime('%d/%m/%Y')} ({nb_collaborateurs} collaborateur{'s' if nb_collaborateurs > 1 else ''})"
+                ajouts.append(ligne_transaction(date_saisie, montant, nb_collaborateurs))
+                changements[date_saisie] = (montant, nb_collaborateurs)
+                messages.append(f"✅ Transaction AJOUTÉE : {formater_euro(montant)} le {date_affichee} ({collaborateurs})")
+        
+        if mises_a_jour or suppressions or ajouts:
+            stockage.ecrire(mises_a_jour, suppressions, ajouts)
+            # Les données préparées suivent la saisie : pas de rechargement du sheet
+            version_apres = appliquer_ecritures_locales(version_avant, mises_a_jour, suppressions, ajouts)
+            if version_apres and patcher_donnees(changements, version_avant, version_apres):
+                mettre_a_jour_instantane(etat)
+            else:
+                etat['prochaine_verification'] = 0.0  # Rafraîchissement dès le prochain affichage
         
-        return True, message
+        return True, messages
         
     except Exception as e:
-        return False, f"❌ Erreur lors de l'enregistrement : {str(e)}"
+        oublier_stockage()
+        return False, [f"❌ Erreur lors de l'enregistrement : {str(e)}"]
+
+def grille_saisie(journalier, debut, fin):
+    """Grille de saisie jour par jour d'une période, pré-remplie avec les données connues"""
+    dates = pd.date_range(debut, fin, freq='D')
+    ca, collaborateurs = valeurs_des_jours(journalier, dates)
+    # Une journée existe dès qu'elle a du CA (seuls les montants > 0 sont gardés),
+    # même si sa colonne Nb_Collaborateurs est vide
+    montants = np.where(ca > 0, ca, np.nan)
+    
+    return pd.DataFrame({
+        'Date': dates.date,
+        'Jour': np.array(JOURS_SEMAINE_FR)[dates.dayofweek],
+        'Montant': montants,
+        'Collaborateurs': pd.Series(collaborateurs).where(collaborateurs > 0).astype('Int64')
+    })
+
+def modifications_grille(initiale, saisie, nb_collaborateurs_defaut=2):
+    """Entrées (date, montant, nb_collaborateurs) des lignes modifiées dans la grille.
+    
+    Un montant vidé ou mis à 0 supprime la date ; un nombre de collaborateurs
+    vide prend la valeur par défaut.
+    """
+    montant_avant = initiale['Montant'].fillna(0).round(2)
+    montant_apres = saisie['Montant'].fillna(0).round(2)
+    collab_avant = initiale['Collaborateurs'].fillna(nb_collaborateurs_defaut).astype(int)
+    collab_apres = saisie['Collaborateurs'].fillna(nb_collaborateurs_defaut).astype(int)
+    
+    modifiees = (montant_apres != montant_avant) | ((montant_apres > 0) & (collab_apres != collab_avant))
+    return [
+        (pd.Timestamp(date), float(montant), int(nb))
+        for date, montant, nb in zip(saisie['Date'][modifiees], montant_apres[modifiees], collab_apres[modifiees])
+    ]
+
+# ==================== JOURNAL D'ENVOI ====================
+
+# Les saisies sont d'abord écrites dans un journal local, puis envoyées
+# vers Google Sheets en arrière-plan (plusieurs saisies d'une même date
+# rapprochées dans le temps ne donnent qu'une écriture)
+FICHIER_JOURNAL = os.path.join(DOSSIER_CACHE, "journal.sqlite")
+DELAI_REGROUPEMENT = 2      # Secondes sans nouvelle saisie avant l'envoi
+DELAI_NOUVEL_ESSAI = 30     # Secondes avant de réessayer un envoi en échec
+
+@st.cache_resource
+def get_etat_envoi():
+    """État partagé de l'envoi du journal vers Google Sheets"""
+    return {
+        'verrou': threading.Lock(),
+        'reveil': threading.Event(),   # Signale une nouvelle saisie au thread d'envoi
+        'thread': None,
+        'erreur': None,                # Dernière erreur d'envoi
+        'dernier_envoi': None
+    }
+
+def connexion_journal():
+    """Ouvre le journal SQLite (créé au besoin)"""
+    os.makedirs(DOSSIER_CACHE, exist_ok=True)
+    conn = sqlite3.connect(FICHIER_JOURNAL, timeout=10)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS journal ("
+        "date TEXT PRIMARY KEY, montant REAL, nb_collaborateurs INTEGER, horodatage REAL)"
+    )
+    return conn
+
+def lire_journal():
+    """Saisies en attente d'envoi (DataFrame date, montant, nb_collaborateurs, horodatage)"""
+    colonnes = ['date', 'montant', 'nb_collaborateurs', 'horodatage']
+    if not os.path.exists(FICHIER_JOURNAL):
+        return pd.DataFrame(columns=colonnes)
+    
+    conn = connexion_journal()
+    try:
+        en_attente = pd.read_sql(f"SELECT {', '.join(colonnes)} FROM journal ORDER BY date", conn)
+    finally:
+        conn.close()
+    
+    en_attente['date'] = pd.to_datetime(en_attente['date'], format='%Y-%m-%d')
+    en_attente['nb_collaborateurs'] = en_attente['nb_collaborateurs'].astype(int)
+    return en_attente
+
+def retirer_du_journal(envoyees):
+    """Retire du journal les saisies envoyées, sauf celles modifiées depuis"""
+    conn = connexion_journal()
+    try:
+        with conn:
+            conn.executemany(
+                "DELETE FROM journal WHERE date = ? AND horodatage = ?",
+                zip(envoyees['date'].dt.strftime('%Y-%m-%d'), envoyees['horodatage'])
+            )
+    finally:
+        conn.close()
+
+def envoyer_journal(etat):
+    """Boucle du thread d'envoi : vide le journal vers Google Sheets"""
+    attente = 0
+    while True:
+        etat['reveil'].wait(timeout=attente)
+        etat['reveil'].clear()
+        
+        try:
+            en_attente = lire_journal()
+            if en_attente.empty:
+                attente = None  # Rien à envoyer : on attend la prochaine saisie
+                continue
+            
+            # Regroupement : on laisse passer les saisies rapprochées
+            calme_depuis = time.time() - en_attente['horodatage'].max()
+            if calme_depuis < DELAI_REGROUPEMENT:
+                attente = DELAI_REGROUPEMENT - calme_depuis
+                continue
+            
+            renouveler_jeton()
+            succes, messages = enregistrer_transactions(
+                en_attente[['date', 'montant', 'nb_collaborateurs']].itertuples(index=False)
+            )
+            if succes:
+                retirer_du_journal(en_attente)
+                etat['erreur'] = None
+                etat['dernier_envoi'] = datetime.now()
+                attente = 0
+            else:
+                etat['erreur'] = messages[0]
+                attente = DELAI_NOUVEL_ESSAI
+        except Exception as e:
+            etat['erreur'] = f"❌ Erreur du journal local : {e}"
+            attente = DELAI_NOUVEL_ESSAI
+
+def demarrer_envoi_journal():
+    """Démarre le thread d'envoi s'il ne tourne pas déjà"""
+    etat = get_etat_envoi()
+    
+    with etat['verrou']:
+        if etat['thread'] is None or not etat['thread'].is_alive():
+            etat['thread'] = threading.Thread(target=envoyer_journal, args=(etat,), daemon=True)
+            etat['thread'].start()
+
+def journaliser_transactions(entrees):
+    """Enregistre des saisies dans le journal local ; l'envoi vers Google Sheets suit en arrière-plan.
+    
+    Même format et même retour que enregistrer_transactions. Si le journal
+    est inaccessible, les saisies sont envoyées directement.
+    """
+    entrees = [(pd.Timestamp(date_saisie).normalize(), float(montant), int(nb_collaborateurs))
+               for date_saisie, montant, nb_collaborateurs in entrees]
+    
+    try:
+        conn = connexion_journal()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO journal VALUES (?, ?, ?, ?) ON CONFLICT(date) DO UPDATE SET "
+                    "montant = excluded.montant, nb_collaborateurs = excluded.nb_collaborateurs, "
+                    "horodatage = excluded.horodatage",
+                    [(date_saisie.strftime('%Y-%m-%d'), montant, nb_collaborateurs, time.time())
+                     for date_saisie, montant, nb_collaborateurs in entrees]
+                )
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return enregistrer_transactions(entrees)
+    
+    demarrer_envoi_journal()
+    get_etat_envoi()['reveil'].set()
+    
+    messages = []
+    for date_saisie, montant, nb_collaborateurs in entrees:
+        if montant == 0:
+            messages.append(f"🗑️ Suppression du {date_saisie.strftime('%d/%m/%Y')} enregistrée, envoi en cours")
+        else:
+            messages.append(
+                f"✅ {formater_euro(montant)} le {date_saisie.strftime('%d/%m/%Y')} "
+                f"({nb_collaborateurs} collaborateur{'s' if nb_collaborateurs > 1 else ''}) enregistré, envoi en cours"
+            )
+    return True, messages
+
+@st.cache_resource(max_entries=4)
+def donnees_avec_attente(version, empreinte_journal, _donnees, _en_attente):
+    """Données d'une version avec les saisies d'un état du journal reportées par-dessus, partagées entre sessions"""
+    changements = {
+        date: (montant, nb)
+        for date, montant, nb in _en_attente[['date', 'montant', 'nb_collaborateurs']].itertuples(index=False)
+    }
+    version_fusion = f"{version}+{empreinte_journal}"
+    donnees = reporter_changements(_donnees, changements, version_fusion)
+    if donnees is None:
+        # Date en double dans le sheet : reconstruction complète
+        df = _donnees['df'][['date', 'montant', 'nb_collaborateurs']]
+        df = df[~df['date'].isin(_en_attente['date'])]
+        ajouts = _en_attente.loc[_en_attente['montant'] > 0, ['date', 'montant', 'nb_collaborateurs']]
+        df = pd.concat([df, ajouts], ignore_index=True).astype(TYPES_DONNEES)
+        donnees = preparer_donnees(df, version_fusion)
+    return donnees
+
+def fusionner_en_attente(donnees, en_attente):
+    """Données affichées avec les saisies pas encore envoyées par-dessus"""
+    saisies = en_attente[['date', 'montant', 'nb_collaborateurs']]
+    return donnees_avec_attente(donnees['version'], empreinte_lignes(saisies.values.tolist()), donnees, saisies)
 
 # ==================== SIDEBAR ====================
 
 st.sidebar.title("📊 L'Atelier de Vincent")
 st.sidebar.markdown("---")
 
-st.sidebar.info("💡 **Données stockées dans Google Sheets**")
-st.sidebar.markdown(f"📋 Sheet ID : `{SPREADSHEET_ID[:10]}...`")
+if TYPE_STOCKAGE == "local":
+    st.sidebar.info("💡 **Données stockées en local (hors ligne)**")
+    st.sidebar.markdown(f"📋 Fichier : `{FICHIER_STOCKAGE_LOCAL}`")
+else:
+    st.sidebar.info("💡 **Données stockées dans Google Sheets**")
+    st.sidebar.markdown(f"📋 Sheet ID : `{SPREADSHEET_ID[:10]}...`")
 
 page = st.sidebar.radio(
     "Navigation",
@@ -850,21 +2289,57 @@ if not verifier_mot_de_passe():
 
 # ==================== CHARGEMENT DES DONNÉES ====================
 
-df = charger_donnees()
+donnees = charger_donnees()
+
+# Saisies du journal local pas encore envoyées vers Google Sheets
+demarrer_envoi_journal()
+try:
+    en_attente = lire_journal()
+except (OSError, sqlite3.Error, pd.errors.DatabaseError):
+    en_attente = pd.DataFrame()
+if not en_attente.empty:
+    if donnees:
+        donnees = fusionner_en_attente(donnees, en_attente)
+    st.sidebar.warning(f"⏳ {len(en_attente)} saisie{'s' if len(en_attente) > 1 else ''} en attente d'envoi")
+    if get_etat_envoi()['erreur']:
+        st.sidebar.caption(get_etat_envoi()['erreur'])
+
+# Appels à l'API Google (quota partagé)
+quota_api = get_quota_api()
+st.sidebar.caption(
+    f"📡 API Google : {quota_api['appels']} appels · {quota_api['nouveaux_essais']} nouveaux essais · "
+    f"{quota_api['limitations']} limitations de quota"
+)
+
+# Fraîcheur des données affichées
+etat_synchro = get_etat_synchro()
+if etat_synchro['donnees'] is not None and etat_synchro['date_donnees']:
+    st.sidebar.caption(
+        f"🕒 Données au {etat_synchro['date_donnees']:%H:%M:%S}"
+        + (" · actualisation en cours…" if etat_synchro['rafraichissement'] else "")
+    )
+elif etat_synchro['date_instantane']:
+    st.sidebar.caption(f"🕒 Données locales du {pd.Timestamp(etat_synchro['date_instantane']):%d/%m/%Y %H:%M:%S}")
+
+# Empreinte mémoire : données partagées entre sessions, fusion des saisies en attente comprise
+with st.sidebar.expander("🧠 Mémoire"):
+    # Tailles mesurées une fois par version des données, lues ici sans rien parcourir
+    taille_brute = etat_synchro['taille_lignes_brutes']
+    partagees = (etat_synchro['donnees'], etat_synchro['donnees_instantane'])
+    taille_partagee = sum(d['taille'] for d in partagees if d is not None)
+    st.caption(
+        f"Partagé : {formater_octets(taille_brute + taille_partagee)} "
+        f"(lignes brutes {formater_octets(taille_brute)} · données préparées {formater_octets(taille_partagee)})"
+    )
+    if donnees is not None and not any(donnees is d for d in partagees):
+        st.caption(f"Saisies en attente fusionnées : {formater_octets(donnees['taille'])} (partagé, une fois par état du journal)")
+
+df = donnees['df'] if donnees else None
+journalier = donnees['journalier'] if donnees else None
 
 if df is not None and not df.empty:
-    # Trouver la dernière date avec une valeur > 0
-    df_avec_valeur = df[df['montant'] > 0]
-    if not df_avec_valeur.empty:
-        derniere_date = df_avec_valeur['date'].max()
-    else:
-        derniere_date = df['date'].max()
-    
-    # Ajouter colonnes calculées
-    df['exercice'] = df['date'].apply(calculer_exercice)
-    df['annee'] = df['date'].dt.year
-    df['mois'] = df['date'].dt.month
-    df['jour_semaine'] = df['date'].dt.day_name()
+    # Dernière date avec une valeur : seuls les montants > 0 sont gardés et l'index est trié
+    derniere_date = df.index[-1]
     
     # ==================== PAGE ACCUEIL ====================
 
@@ -897,8 +2372,7 @@ if df is not None and not df.empty:
         _annee_ex = int(exercice_actuel.split('/')[0])
         _debut_ex = datetime(_annee_ex, 7, 1)
         _fin_ex = datetime(_annee_ex + 1, 6, 30)
-        df_exercice_actuel = df[(df['date'] >= _debut_ex) & (df['date'] <= _fin_ex)]
-        ca_actuel = df_exercice_actuel['montant'].sum()
+        ca_actuel = ca_periode(journalier, _debut_ex, _fin_ex)
         
         # Pourcentage de progression
         pourcentage_progression = (ca_actuel / objectif_ca * 100) if objectif_ca > 0 else 0
@@ -998,22 +2472,11 @@ if df is not None and not df.empty:
         date_n = derniere_date
         jour_semaine_n = date_n.strftime('%A')
         
-        # Trouver le même jour de semaine l'année précédente (avec gestion 29 février)
-        try:
-            date_n_moins_1_approx = date_n.replace(year=date_n.year - 1)
-        except ValueError:
-            # Cas du 29 février en année non bissextile → utiliser 28 février
-            date_n_moins_1_approx = datetime(date_n.year - 1, 2, 28)
-        
-        # Chercher le même jour de semaine dans une fenêtre de +/- 3 jours
-        for delta in range(-3, 4):
-            date_candidate = date_n_moins_1_approx + timedelta(days=delta)
-            if date_candidate.strftime('%A') == jour_semaine_n:
-                date_n_moins_1 = date_candidate
-                break
+        # Même jour de semaine l'année précédente (table d'alignement N → N-1)
+        date_n_moins_1 = dates_n_moins_1(donnees, [date_n])[0]
         
-        ca_jour_n = df[df['date'] == date_n]['montant'].sum()
-        ca_jour_n_moins_1 = df[df['date'] == date_n_moins_1]['montant'].sum()
+        ca_jour_n = ca_periode(journalier, date_n, date_n)
+        ca_jour_n_moins_1 = ca_periode(journalier, date_n_moins_1, date_n_moins_1)
         
         evolution_jour_euro = ca_jour_n - ca_jour_n_moins_1
         evolution_jour_pct = (evolution_jour_euro / ca_jour_n_moins_1 * 100) if ca_jour_n_moins_1 != 0 else 0
@@ -1048,8 +2511,7 @@ if df is not None and not df.empty:
         
         # Cumul mois N
         debut_mois_n = date_n.replace(day=1)
-        df_mois_n = df[(df['date'] >= debut_mois_n) & (df['date'] <= date_n)]
-        cumul_mois_n = df_mois_n['montant'].sum()
+        cumul_mois_n = ca_periode(journalier, debut_mois_n, date_n)
         
         nb_jours_ecoules = jour_actuel
         
@@ -1057,27 +2519,12 @@ if df is not None and not df.empty:
         mois_n_moins_1 = mois_actuel
         annee_n_moins_1 = annee_actuelle - 1
         
-        # Trouver le même jour de semaine l'année précédente (comme pour la comparaison journalière)
-        jour_semaine_n = date_n.strftime('%A')
-        
-        try:
-            date_fin_n_moins_1_approx = date_n.replace(year=annee_n_moins_1)
-        except ValueError:
-            # Cas du 29 février en année non bissextile → utiliser 28 février
-            date_fin_n_moins_1_approx = datetime(annee_n_moins_1, 2, 28)
-        
-        # Chercher le même jour de semaine dans une fenêtre de +/- 3 jours
-        date_fin_n_moins_1 = date_fin_n_moins_1_approx  # Valeur par défaut
-        for delta in range(-3, 4):
-            date_candidate = date_fin_n_moins_1_approx + timedelta(days=delta)
-            if date_candidate.strftime('%A') == jour_semaine_n and date_candidate.month == mois_n_moins_1:
-                date_fin_n_moins_1 = date_candidate
-                break
+        # Même jour de semaine l'année précédente, sans sortir du mois (table d'alignement N → N-1)
+        date_fin_n_moins_1 = dates_n_moins_1(donnees, [date_n], meme_mois=True)[0]
         
         debut_mois_n_moins_1 = datetime(annee_n_moins_1, mois_n_moins_1, 1)
         
-        df_mois_n_moins_1 = df[(df['date'] >= debut_mois_n_moins_1) & (df['date'] <= date_fin_n_moins_1)]
-        cumul_mois_n_moins_1 = df_mois_n_moins_1['montant'].sum()
+        cumul_mois_n_moins_1 = ca_periode(journalier, debut_mois_n_moins_1, date_fin_n_moins_1)
         
         jour_fin_n_moins_1 = date_fin_n_moins_1.day
         dernier_jour_mois_n_moins_1 = calendar.monthrange(annee_n_moins_1, mois_n_moins_1)[1]
@@ -1086,8 +2533,7 @@ if df is not None and not df.empty:
         # On prend le mois COMPLET de N-1 (pas juste les jours écoulés)
         debut_mois_complet_n_moins_1 = datetime(annee_n_moins_1, mois_n_moins_1, 1)
         fin_mois_complet_n_moins_1 = datetime(annee_n_moins_1, mois_n_moins_1, dernier_jour_mois_n_moins_1)
-        df_mois_complet_n_moins_1 = df[(df['date'] >= debut_mois_complet_n_moins_1) & (df['date'] <= fin_mois_complet_n_moins_1)]
-        ca_mois_complet_n_moins_1 = df_mois_complet_n_moins_1['montant'].sum()
+        ca_mois_complet_n_moins_1 = ca_periode(journalier, debut_mois_complet_n_moins_1, fin_mois_complet_n_moins_1)
         
         # Objectif = CA mois N-1 complet + 4%
         objectif_mois = ca_mois_complet_n_moins_1 * 1.04
@@ -1195,9 +2641,7 @@ if df is not None and not df.empty:
         dernier_jour_complet = calendar.monthrange(annee_n_moins_1, mois_n_moins_1)[1]
         fin_mois_complet_n_moins_1 = datetime(annee_n_moins_1, mois_n_moins_1, dernier_jour_complet)
         
-        df_mois_complet_n_moins_1 = df[(df['date'] >= debut_mois_complet_n_moins_1) & 
-                                        (df['date'] <= fin_mois_complet_n_moins_1)]
-        ca_total_mois_n_moins_1 = df_mois_complet_n_moins_1['montant'].sum()
+        ca_total_mois_n_moins_1 = ca_periode(journalier, debut_mois_complet_n_moins_1, fin_mois_complet_n_moins_1)
         
         # Reste à faire
         reste_a_faire = ca_total_mois_n_moins_1 - cumul_mois_n
@@ -1229,13 +2673,11 @@ if df is not None and not df.empty:
         annee_debut_exercice = int(exercice_actuel.split('/')[0])
         
         debut_exercice_n = datetime(annee_debut_exercice, 7, 1)
-        df_exercice_n = df[(df['date'] >= debut_exercice_n) & (df['date'] <= date_n)]
-        cumul_exercice_n = df_exercice_n['montant'].sum()
+        cumul_exercice_n = ca_periode(journalier, debut_exercice_n, date_n)
         
         # Même période exercice précédent (utilise date_n_moins_1 du calcul journalier)
         debut_exercice_n_moins_1 = datetime(annee_debut_exercice - 1, 7, 1)
-        df_exercice_n_moins_1 = df[(df['date'] >= debut_exercice_n_moins_1) & (df['date'] <= date_n_moins_1)]
-        cumul_exercice_n_moins_1 = df_exercice_n_moins_1['montant'].sum()
+        cumul_exercice_n_moins_1 = ca_periode(journalier, debut_exercice_n_moins_1, date_n_moins_1)
         
         nb_jours_exercice_n = (date_n - debut_exercice_n).days + 1
         nb_jours_exercice_n_moins_1 = (date_n_moins_1 - debut_exercice_n_moins_1).days + 1
@@ -1267,80 +2709,135 @@ if df is not None and not df.empty:
        # ========== SECTION 4 : FORMULAIRE DE SAISIE ==========
         st.subheader("➕ Saisir une nouvelle entrée")
         
-        with st.form("formulaire_saisie_accueil"):
-            st.markdown("**📅 Date**")
-            col_jour, col_mois, col_annee = st.columns(3)
+        mode_saisie = st.radio(
+            "Mode de saisie",
+            options=["Une date", "Semaine en cours", "Mois en cours"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
+        
+        if mode_saisie != "Une date":
+            # ---------- Saisie groupée : grille de la semaine ou du mois ----------
+            aujourd_hui = pd.Timestamp(datetime.now().date())
+            if mode_saisie == "Semaine en cours":
+                debut_grille = aujourd_hui - pd.Timedelta(days=aujourd_hui.dayofweek)
+                fin_grille = debut_grille + pd.Timedelta(days=6)
+            else:
+                debut_grille = aujourd_hui.replace(day=1)
+                fin_grille = debut_grille + pd.offsets.MonthEnd(0)
             
-            # Date du jour par défaut
-            aujourd_hui = datetime.now()
+            grille = grille_saisie(journalier, debut_grille, fin_grille)
             
-            with col_jour:
-                jour = st.selectbox(
-                    "Jour",
-                    options=list(range(1, 32)),
-                    index=aujourd_hui.day - 1,
-                    label_visibility="collapsed"
+            with st.form("grille_saisie_accueil"):
+                st.caption("Modifiez les montants puis enregistrez : seules les lignes changées sont envoyées. Un montant vidé ou à 0 supprime la journée.")
+                grille_modifiee = st.data_editor(
+                    grille,
+                    key=f"grille_{debut_grille:%Y%m%d}_{fin_grille:%Y%m%d}",
+                    num_rows="fixed",
+                    hide_index=True,
+                    use_container_width=True,
+                    disabled=["Date", "Jour"],
+                    column_config={
+                        "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
+                        "Jour": st.column_config.TextColumn("Jour", width="small"),
+                        "Montant": st.column_config.NumberColumn("Montant (€)", min_value=0.0, step=0.01, format="%.2f €"),
+                        "Collaborateurs": st.column_config.NumberColumn(
+                            "Collaborateurs", min_value=1, max_value=4, step=1,
+                            help="Vide = 2 (Patron + CDI)"
+                        )
+                    }
                 )
-            
-            with col_mois:
-                mois_fr = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
-                           'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
-                mois = st.selectbox(
-                    "Mois",
-                    options=mois_fr,
-                    index=aujourd_hui.month - 1,
+                
+                submit_grille = st.form_submit_button("✅ Enregistrer les modifications", use_container_width=True)
+                
+                if submit_grille:
+                    entrees = modifications_grille(grille, grille_modifiee)
+                    
+                    if not entrees:
+                        st.info("ℹ️ Aucune modification à enregistrer")
+                    else:
+                        succes, messages = journaliser_transactions(entrees)
+                        
+                        if succes:
+                            st.success(f"✅ {len(entrees)} journée{'s' if len(entrees) > 1 else ''} enregistrée{'s' if len(entrees) > 1 else ''}")
+                            st.rerun()
+                        else:
+                            st.error(messages[0])
+        
+        else:
+            with st.form("formulaire_saisie_accueil"):
+                st.markdown("**📅 Date**")
+                col_jour, col_mois, col_annee = st.columns(3)
+                
+                # Date du jour par défaut
+                aujourd_hui = datetime.now()
+                
+                with col_jour:
+                    jour = st.selectbox(
+                        "Jour",
+                        options=list(range(1, 32)),
+                        index=aujourd_hui.day - 1,
+                        label_visibility="collapsed"
+                    )
+                
+                with col_mois:
+                    mois_fr = ['Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
+                               'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre']
+                    mois = st.selectbox(
+                        "Mois",
+                        options=mois_fr,
+                        index=aujourd_hui.month - 1,
+                        label_visibility="collapsed"
+                    )
+                    mois_numero = mois_fr.index(mois) + 1
+                
+                with col_annee:
+                    annee = st.selectbox(
+                        "Année",
+                        options=list(range(2019, 2031)),
+                        index=list(range(2019, 2031)).index(aujourd_hui.year),
+                        label_visibility="collapsed"
+                    )
+                
+                # Construire la date
+                try:
+                    date_saisie = datetime(annee, mois_numero, jour)
+                except ValueError:
+                    # Si la date est invalide (ex: 31 février)
+                    st.error("⚠️ Date invalide")
+                    date_saisie = aujourd_hui
+                
+                st.markdown("**💰 Montant**")
+                montant_saisie = st.number_input(
+                    "Montant (€)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=0.01,
+                    format="%.2f",
                     label_visibility="collapsed"
                 )
-                mois_numero = mois_fr.index(mois) + 1
-            
-            with col_annee:
-                annee = st.selectbox(
-                    "Année",
-                    options=list(range(2019, 2031)),
-                    index=list(range(2019, 2031)).index(aujourd_hui.year),
-                    label_visibility="collapsed"
+                
+                st.markdown("**👥 Nombre de collaborateurs**")
+                nb_collaborateurs = st.selectbox(
+                    "Nombre de collaborateurs",
+                    options=[1, 2, 3, 4],
+                    index=1,  # Par défaut : 2 personnes (Patron + CDI)
+                    label_visibility="collapsed",
+                    help="1 = Patron seul | 2 = Patron + CDI | 3 = Patron + CDI + Stagiaire | 4 = Patron + CDI + 2 Stagiaires"
                 )
-            
-            # Construire la date
-            try:
-                date_saisie = datetime(annee, mois_numero, jour)
-            except ValueError:
-                # Si la date est invalide (ex: 31 février)
-                st.error("⚠️ Date invalide")
-                date_saisie = aujourd_hui
-            
-            st.markdown("**💰 Montant**")
-            montant_saisie = st.number_input(
-                "Montant (€)",
-                min_value=0.0,
-                value=0.0,
-                step=0.01,
-                format="%.2f",
-                label_visibility="collapsed"
-            )
-            
-            st.markdown("**👥 Nombre de collaborateurs**")
-            nb_collaborateurs = st.selectbox(
-                "Nombre de collaborateurs",
-                options=[1, 2, 3, 4],
-                index=1,  # Par défaut : 2 personnes (Patron + CDI)
-                label_visibility="collapsed",
-                help="1 = Patron seul | 2 = Patron + CDI | 3 = Patron + CDI + Stagiaire | 4 = Patron + CDI + 2 Stagiaires"
-            )
-            
-            submit = st.form_submit_button("✅ Enregistrer", use_container_width=True)
-            
-            if submit:
-                if montant_saisie >= 0:
-                    succes, message = enregistrer_transaction(date_saisie, montant_saisie, nb_collaborateurs)
-                    
-                    if succes:
-                        st.success(message)
-                        st.balloons()
-                        st.cache_data.clear()
-                        st.rerun()
-                    else:
-                        st.error(message)
+                
+                submit = st.form_submit_button("✅ Enregistrer", use_container_width=True)
+                
+                if submit:
+                    if montant_saisie >= 0:
+                        succes, messages = journaliser_transactions([(date_saisie, montant_saisie, nb_collaborateurs)])
+                        
+                        if succes:
+                            st.success(messages[0])
+                            st.balloons()
+                            st.rerun()
+                        else:
+                            st.error(messages[0])
                         
         st.markdown("---")
         
@@ -1425,59 +2922,18 @@ if df is not None and not df.empty:
         # Bouton Export PDF (sera activé après calcul des données)
         placeholder_pdf_button = st.empty()
     
-        # Créer les données du tableau
-        donnees_tableau = []
-    
-        for jour in range(1, nb_jours_mois + 1):
-            date_n = datetime(annee_mois_n, mois_numero, jour)
-            jour_semaine = date_n.weekday()  # 0 = Lundi, 6 = Dimanche
-        
-            # Trouver la date N-1 correspondante (même jour de la semaine)
-            # Chercher le même jour de la semaine dans l'année N-1
-            date_reference_n_moins_1 = datetime(annee_mois_n_moins_1, mois_numero, jour)
-            jours_diff = (jour_semaine - date_reference_n_moins_1.weekday()) % 7
-        
-            if jours_diff <= 3:
-                date_n_moins_1 = date_reference_n_moins_1 + timedelta(days=jours_diff)
-            else:
-                date_n_moins_1 = date_reference_n_moins_1 - timedelta(days=7 - jours_diff)
-        
-            # Récupérer les montants et le nombre de collaborateurs
-            data_n = df[df['date'] == date_n]
-            montant_n = data_n['montant'].sum()
-            nb_collab_n = data_n['nb_collaborateurs'].max() if not data_n.empty else 0
-            
-            data_n_moins_1 = df[df['date'] == date_n_moins_1]
-            montant_n_moins_1 = data_n_moins_1['montant'].sum()
-            nb_collab_n_moins_1 = data_n_moins_1['nb_collaborateurs'].max() if not data_n_moins_1.empty else 0
-        
-            # Noms des jours en français
-            jours_fr = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
-            nom_jour = jours_fr[jour_semaine]
-        
-            donnees_tableau.append({
-                'Jour': nom_jour,
-                'Date N-1': date_n_moins_1.strftime('%d/%m/%Y'),
-                'Date N': date_n.strftime('%d/%m/%Y'),
-                'Montant N-1': formater_euro(montant_n_moins_1) if montant_n_moins_1 > 0 else '-',
-                'Nb Collab N-1': str(nb_collab_n_moins_1) if montant_n_moins_1 > 0 else '-',
-                'Montant N': formater_euro(montant_n) if montant_n > 0 else '-',
-                'Nb Collab N': str(nb_collab_n) if montant_n > 0 else '-'
-            })
-    
-        # Créer le DataFrame
-        df_tableau = pd.DataFrame(donnees_tableau)
+        # Tableau jour par jour, calculé en une passe vectorisée
+        df_tableau = tableau_suivi(donnees, annee_mois_n, mois_numero)
+        donnees_tableau = df_tableau.to_dict('records')
         
         # Calculer les totaux pour le PDF (avant l'affichage)
         debut_mois_n = datetime(annee_mois_n, mois_numero, 1)
         fin_mois_n = datetime(annee_mois_n, mois_numero, nb_jours_mois)
-        df_mois_n = df[(df['date'] >= debut_mois_n) & (df['date'] <= fin_mois_n)]
-        total_n = df_mois_n['montant'].sum()
+        total_n = ca_periode(journalier, debut_mois_n, fin_mois_n)
         
         debut_mois_n_moins_1 = datetime(annee_mois_n_moins_1, mois_numero, 1)
-        fin_mois_n_moins_1 = datetime(annee_mois_n_moins_1, mois_numero, nb_jours_mois)
-        df_mois_n_moins_1 = df[(df['date'] >= debut_mois_n_moins_1) & (df['date'] <= fin_mois_n_moins_1)]
-        total_n_moins_1 = df_mois_n_moins_1['montant'].sum()
+        fin_mois_n_moins_1 = datetime(annee_mois_n_moins_1, mois_numero, calendar.monthrange(annee_mois_n_moins_1, mois_numero)[1])
+        total_n_moins_1 = ca_periode(journalier, debut_mois_n_moins_1, fin_mois_n_moins_1)
         
         evolution_euro = total_n - total_n_moins_1
         evolution_pct = (evolution_euro / total_n_moins_1 * 100) if total_n_moins_1 != 0 else 0
@@ -1561,7 +3017,7 @@ if df is not None and not df.empty:
                 with st.spinner("Génération du PDF en cours..."):
                     # Générer le PDF
                     exercices_temp = sorted(df['exercice'].unique())
-                    pdf_buffer = generer_pdf_historique(df, exercices_temp)
+                    pdf_buffer = generer_pdf_historique(donnees['cube'], exercices_temp)
                     
                     # Téléchargement
                     st.download_button(
@@ -1575,13 +3031,9 @@ if df is not None and not df.empty:
         
         st.markdown("---")
         
-        # ========== MAPPING DES JOURS EN FRANÇAIS ==========
-        # La colonne jour_semaine existe déjà en anglais, on la mappe en français
-        jours_en_fr = {
-            'Monday': 'Lundi', 'Tuesday': 'Mardi', 'Wednesday': 'Mercredi',
-            'Thursday': 'Jeudi', 'Friday': 'Vendredi', 'Saturday': 'Samedi', 'Sunday': 'Dimanche'
-        }
-        df['jour_semaine_fr'] = df['jour_semaine'].map(jours_en_fr)
+        # Tous les tableaux de la page sont lus dans le cube pré-agrégé au chargement
+        cube = donnees['cube']
+        stats = stats_par_exercice(cube)
         
         # Liste des exercices disponibles
         exercices = sorted(df['exercice'].unique())
@@ -1592,21 +3044,14 @@ if df is not None and not df.empty:
         stats_exercices = []
         
         for exercice in exercices:
-            df_exercice = df[df['exercice'] == exercice]
-            
             # CA Total
-            ca_total = df_exercice['montant'].sum()
+            ca_total = stats.loc[exercice, 'ca']
             
-            # Moyenne de collaborateurs
-            # On prend la moyenne des jours où il y a eu du CA
-            df_avec_ca = df_exercice[df_exercice['montant'] > 0]
-            if len(df_avec_ca) > 0:
-                moyenne_collab = df_avec_ca['nb_collaborateurs'].mean()
-            else:
-                moyenne_collab = 0
+            # Moyenne de collaborateurs (sur les jours où il y a eu du CA)
+            moyenne_collab = stats.loc[exercice, 'moyenne_collaborateurs']
             
             # Nombre de jours travaillés (jours avec CA > 0)
-            nb_jours_travailles = len(df_avec_ca)
+            nb_jours_travailles = int(stats.loc[exercice, 'nb_jours'])
             
             # CA moyen journalier (sur jours travaillés uniquement)
             if nb_jours_travailles > 0:
@@ -1635,56 +3080,20 @@ if df is not None and not df.empty:
         # ========== SECTION 2 : TABLEAU DES MONTANTS MENSUELS PAR EXERCICE ==========
         st.subheader("📊 Montants Mensuels par Exercice")
         
-        # Ordre des mois (juillet à juin pour correspondre à l'exercice fiscal)
-        mois_ordre = ['Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre',
-                      'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin']
-        
-        # Mapping nom du mois -> numéro du mois
-        mois_mapping = {
-            'Juillet': 7, 'Août': 8, 'Septembre': 9, 'Octobre': 10, 'Novembre': 11, 'Décembre': 12,
-            'Janvier': 1, 'Février': 2, 'Mars': 3, 'Avril': 4, 'Mai': 5, 'Juin': 6
-        }
-        
-        # Préparer les données
-        monthly_data = []
-        for exercice in exercices:
-            if exercice >= '2019/2020':  # Filtrer à partir de 2019/2020
-                row = {'Exercice': exercice}
-                df_ex = df[df['exercice'] == exercice]
-                
-                for mois_nom in mois_ordre:
-                    mois_num = mois_mapping[mois_nom]
-                    montant = df_ex[df_ex['mois'] == mois_num]['montant'].sum()
-                    row[mois_nom] = montant
-                
-                # Ajouter le total annuel
-                row['Total'] = df_ex['montant'].sum()
-                monthly_data.append(row)
-        
-        # Créer le DataFrame
-        df_monthly = pd.DataFrame(monthly_data)
-        
-        # Ajouter une ligne "Moyenne" en bas
-        moyenne_row = {'Exercice': 'Moyenne'}
-        for mois in mois_ordre:
-            moyenne_row[mois] = df_monthly[mois].mean()
-        moyenne_row['Total'] = df_monthly['Total'].mean()
-        df_monthly = pd.concat([df_monthly, pd.DataFrame([moyenne_row])], ignore_index=True)
+        # Tableau complet (Total et Moyenne compris) lu dans le cube, gardé par version d'exercice
+        df_monthly = tableau_montants_mensuels(donnees)
         
-        # Formater l'affichage
+        # Formater l'affichage (les montants restent numériques)
         def formater_montant(val):
-            if isinstance(val, (int, float)):
-                return f"{val:,.2f} €".replace(',', ' ')
-            return val
+            return f"{val:,.2f} €".replace(',', ' ')
         
-        # Créer un dictionnaire de formatage pour toutes les colonnes sauf 'Exercice'
-        format_dict = {col: formater_montant for col in df_monthly.columns if col != 'Exercice'}
+        colonnes_montants = [col for col in df_monthly.columns if col != 'Exercice']
         
         # Afficher le tableau avec formatage
         st.dataframe(
-            df_monthly.style.format(format_dict).set_properties(**{
+            df_monthly.style.format(formater_montant, subset=colonnes_montants).set_properties(**{
                 'text-align': 'right'
-            }, subset=[col for col in df_monthly.columns if col != 'Exercice']),
+            }, subset=colonnes_montants),
             hide_index=True,
             use_container_width=True,
             height=400
@@ -1695,22 +3104,15 @@ if df is not None and not df.empty:
         # ========== SECTION 3 : TABLEAU COMPARATIF PAR JOUR DE LA SEMAINE ==========
         st.subheader("📅 Tableau Comparatif par Jour de la Semaine")
         
-        # Ordre des jours
-        jours_ordre = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+        # CA et nombre de jours travaillés par exercice et jour de la semaine
+        ca_jours = tableau_cube(cube, 'jour_semaine')
+        nb_jours_semaine = tableau_cube(cube, 'jour_semaine', 'nb_jours')
         
         # Créer un tableau avec tous les exercices côte à côte
-        tableau_comparatif = {'Jour': jours_ordre}
+        tableau_comparatif = {'Jour': JOURS_SEMAINE_FR}
         
         for exercice in exercices:
-            df_exercice = df[df['exercice'] == exercice]
-            
-            ca_par_jour = []
-            for jour in jours_ordre:
-                df_jour = df_exercice[df_exercice['jour_semaine_fr'] == jour]
-                ca_jour = df_jour['montant'].sum()
-                ca_par_jour.append(formater_euro(ca_jour))
-            
-            tableau_comparatif[exercice] = ca_par_jour
+            tableau_comparatif[exercice] = [formater_euro(ca) for ca in ca_jours.loc[exercice]]
         
         # Créer et afficher le DataFrame comparatif
         df_comparatif = pd.DataFrame(tableau_comparatif)
@@ -1723,19 +3125,13 @@ if df is not None and not df.empty:
             for exercice in exercices:
                 st.markdown(f"#### Exercice {exercice}")
                 
-                df_exercice = df[df['exercice'] == exercice]
-                
-                # Calculer le CA cumulé par jour de la semaine
+                # CA cumulé par jour de la semaine
                 ca_par_jour = []
-                for jour in jours_ordre:
-                    df_jour = df_exercice[df_exercice['jour_semaine_fr'] == jour]
-                    ca_jour = df_jour['montant'].sum()
-                    nb_occurrences = len(df_jour[df_jour['montant'] > 0])
-                    
+                for jour, jour_fr in zip(JOURS_SEMAINE, JOURS_SEMAINE_FR):
                     ca_par_jour.append({
-                        'Jour': jour,
-                        'CA Cumulé': formater_euro(ca_jour),
-                        'Nb Jours': nb_occurrences
+                        'Jour': jour_fr,
+                        'CA Cumulé': formater_euro(ca_jours.loc[exercice, jour]),
+                        'Nb Jours': int(nb_jours_semaine.loc[exercice, jour])
                     })
                 
                 # Afficher le tableau
@@ -1754,14 +3150,11 @@ if df is not None and not df.empty:
                 
                 with col2:
                     # Afficher le total de l'exercice
-                    total_exercice = df_exercice['montant'].sum()
+                    total_exercice = stats.loc[exercice, 'ca']
                     st.metric("Total Exercice", formater_euro(total_exercice))
                     
                     # Meilleur jour
-                    ca_valeurs = []
-                    for row in ca_par_jour:
-                        ca_str = row['CA Cumulé'].replace(' €', '').replace(',', '.').replace(' ', '')
-                        ca_valeurs.append(float(ca_str))
+                    ca_valeurs = list(ca_jours.loc[exercice])
                     
                     if ca_valeurs and max(ca_valeurs) > 0:
                         idx_max = ca_valeurs.index(max(ca_valeurs))
@@ -1824,8 +3217,7 @@ if df is not None and not df.empty:
             date_actuelle = max(aujourd_hui, debut_exercice)
         
         # Filtrer les données de l'exercice sélectionné (borné par début ET fin d'exercice)
-        df_exercice = df[(df['date'] >= debut_exercice) & (df['date'] <= min(date_actuelle, fin_exercice))]
-        ca_actuel = df_exercice['montant'].sum()
+        ca_actuel = ca_periode(journalier, debut_exercice, min(date_actuelle, fin_exercice))
         
         # Calculer les jours écoulés et restants
         jours_ecoules = (date_actuelle - debut_exercice).days + 1
@@ -1833,7 +3225,7 @@ if df is not None and not df.empty:
         jours_restants = jours_totaux_exercice - jours_ecoules
         
         # Calculer les jours travaillés (jours avec CA > 0)
-        jours_travailles = len(df_exercice[df_exercice['montant'] > 0])
+        jours_travailles = jours_travailles_periode(journalier, debut_exercice, min(date_actuelle, fin_exercice))
         
         # ========== SECTION 1 : VUE D'ENSEMBLE ==========
         st.subheader(f"📊 Exercice {exercice_actuel} - Vue d'ensemble")
@@ -2051,8 +3443,7 @@ if df is not None and not df.empty:
             dernier_jour_mois = calendar.monthrange(annee_mois, mois_num)[1]
             fin_mois = datetime(annee_mois, mois_num, dernier_jour_mois)
             
-            df_mois = df[(df['date'] >= debut_mois) & (df['date'] <= fin_mois)]
-            ca_mois = df_mois['montant'].sum()
+            ca_mois = ca_periode(journalier, debut_mois, fin_mois)
             
             # Statut
             if fin_mois < date_actuelle:
@@ -2094,13 +3485,11 @@ if df is not None and not df.empty:
             if fin_mois <= date_actuelle:
                 # Mois terminé
                 total_objectif_ecoule += OBJECTIFS_MENSUELS[mois_nom]
-                df_mois = df[(df['date'] >= debut_mois) & (df['date'] <= fin_mois)]
-                total_realise_ecoule += df_mois['montant'].sum()
+                total_realise_ecoule += ca_periode(journalier, debut_mois, fin_mois)
             elif debut_mois <= date_actuelle < fin_mois:
                 # Mois en cours
                 total_objectif_ecoule += OBJECTIFS_MENSUELS[mois_nom]
-                df_mois = df[(df['date'] >= debut_mois) & (df['date'] <= date_actuelle)]
-                total_realise_ecoule += df_mois['montant'].sum()
+                total_realise_ecoule += ca_periode(journalier, debut_mois, date_actuelle)
             # Sinon, mois futur : on ne compte pas
         
         total_ecart = total_realise_ecoule - total_objectif_ecoule
@@ -2296,12 +3685,38 @@ if df is not None and not df.empty:
     
     elif page == "⚙️ Données brutes":
         st.title("⚙️ Données brutes")
-        st.dataframe(df, use_container_width=True)
+        
+        rapport = get_etat_synchro()['rapport']
+        if rapport:
+            st.caption(
+                f"📋 {rapport['lignes']} lignes lues dans le sheet · {rapport['lignes_retenues']} retenues · "
+                f"{rapport['dates_invalides']} dates invalides · {rapport['dates_repli']} dates hors format d/m/yyyy · "
+                f"{rapport['montants_rejetes']} montants illisibles · "
+                f"{rapport['collaborateurs_corriges']} nombres de collaborateurs corrigés"
+            )
+        
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        
+        if TYPE_STOCKAGE == "sheets":
+            # Copie brute pour travailler hors ligne (ATELIER_STOCKAGE=local). Tant que la
+            # première synchronisation n'a pas chargé les lignes (page servie depuis
+            # l'instantané), la copie viderait le stockage local, en-tête comprise
+            valeurs_sheet = get_etat_synchro()['valeurs']
+            if st.button(
+                "📥 Copier le sheet en local",
+                disabled=not valeurs_sheet,
+                help=None if valeurs_sheet else "Lignes du sheet pas encore chargées, réessayez dans un instant"
+            ):
+                StockageLocal(FICHIER_STOCKAGE_LOCAL).remplacer(valeurs_sheet)
+                st.success(f"✅ Sheet copié dans {FICHIER_STOCKAGE_LOCAL}")
         
         # Watermark
         afficher_watermark()
 
 else:
-    st.error("❌ Impossible de charger les données depuis Google Sheets")
-    st.info("💡 Vérifiez que les secrets sont bien configurés dans Streamlit Cloud")
+    st.error("❌ Impossible de charger les données")
+    if TYPE_STOCKAGE == "local":
+        st.info(f"💡 Vérifiez le fichier `{FICHIER_STOCKAGE_LOCAL}`")
+    else:
+        st.info("💡 Vérifiez que les secrets sont bien configurés dans Streamlit Cloud")
 
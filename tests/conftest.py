@@ -0,0 +1,34 @@
+"""
+Chargement des fonctions de app.py pour les tests.
+
+app.py est un script Streamlit : l'importer exécuterait toutes les pages.
+On n'en garde que les imports, les fonctions, les classes et les constantes
+(noms en majuscules), sans rien exécuter d'autre.
+"""
+
+import ast
+import os
+
+import pytest
+
+FICHIER_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def est_definition(noeud):
+    """Noeud de premier niveau à garder : import, fonction, classe ou constante"""
+    if isinstance(noeud, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef)):
+        return True
+    return isinstance(noeud, ast.Assign) and all(
+        isinstance(cible, ast.Name) and cible.id.isupper() for cible in noeud.targets
+    )
+
+
+@pytest.fixture(scope="session")
+def app():
+    """Espace de noms avec les définitions de app.py"""
+    with open(FICHIER_APP, encoding="utf-8") as fichier:
+        module = ast.parse(fichier.read(), FICHIER_APP)
+    module.body = [noeud for noeud in module.body if est_definition(noeud)]
+    espace = {"__name__": "app"}
+    exec(compile(module, FICHIER_APP, "exec"), espace)
+    return espace
@@ -0,0 +1,112 @@
+"""
+Agrégats tenus à jour par deltas (CA journalier et cube) comparés à un recalcul complet.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+COLONNES = ['date', 'montant', 'nb_collaborateurs']
+
+# Historique de référence : exercice 2022/2023 (juin 2023) et 2023/2024, sans dimanches ni lundis
+DATES = [date for date in pd.date_range('2023-06-01', '2024-06-20') if date.dayofweek not in (0, 6)]
+
+CHANGEMENTS = {
+    'ajout': {pd.Timestamp('2023-11-13'): (420.5, 2)},
+    'modification': {pd.Timestamp('2023-11-15'): (99.99, 3)},
+    'suppression': {pd.Timestamp('2023-11-16'): (0, 2)},
+    'suppression_extremites': {DATES[0]: (0, 2), DATES[-1]: (0, 2)},
+    'avant_le_calendrier': {pd.Timestamp('2023-05-25'): (150.0, 1)},
+    'apres_le_calendrier': {pd.Timestamp('2024-06-27'): (310.1, 2)},
+    'nouvel_exercice': {pd.Timestamp('2024-07-05'): (80.0, 1), pd.Timestamp('2021-03-10'): (45.3, 1)},
+    'melange': {
+        pd.Timestamp('2023-11-13'): (420.5, 2),
+        pd.Timestamp('2023-11-15'): (99.99, 3),
+        pd.Timestamp('2023-11-16'): (0, 2),
+        pd.Timestamp('2024-07-05'): (80.0, 1),
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def donnees(app):
+    """Données préparées à partir de l'historique de référence"""
+    df = pd.DataFrame(
+        [(date, 100 + (i % 37) * 12.35, 1 + i % 3) for i, date in enumerate(DATES)],
+        columns=COLONNES
+    ).astype(app['TYPES_DONNEES'])
+    return app['preparer_donnees'](df, 'v0')
+
+
+def frame_recalculee(app, donnees, changements):
+    """DataFrame préparé directement à partir de l'historique modifié"""
+    df = donnees['df'][COLONNES]
+    df = df[~df['date'].isin(list(changements))]
+    ajouts = pd.DataFrame(
+        [(date, montant, nb) for date, (montant, nb) in changements.items() if montant > 0],
+        columns=COLONNES
+    ).astype(df.dtypes.to_dict())
+    df = pd.concat([df, ajouts], ignore_index=True)
+    return app['indexer_par_date'](app['ajouter_colonnes_calculees'](df))
+
+
+def deltas_de(app, donnees, changements):
+    """Deltas (date, ancien, nouveau) des journées modifiées, comme lors d'une saisie"""
+    df = donnees['df']
+    anciennes = dict(zip(df.index, zip(app['montants_euros'](df), df['nb_collaborateurs'])))
+    return [
+        (date, anciennes.get(date), (round(montant, 2), nb) if montant > 0 else None)
+        for date, (montant, nb) in changements.items()
+    ]
+
+
+def verifier_agregats(app, journalier, cube, df):
+    """Agrégats identiques à ceux d'un recalcul complet sur df"""
+    attendu = app['construire_ca_journalier'](df)
+    assert journalier['debut'] == attendu['debut']
+    for cle in ('ca', 'nb_collaborateurs', 'cumul_ca', 'cumul_lignes'):
+        np.testing.assert_allclose(journalier[cle], attendu[cle], strict=True, err_msg=cle)
+    pd.testing.assert_frame_equal(cube, app['construire_cube'](df))
+
+
+@pytest.mark.parametrize("cas", list(CHANGEMENTS))
+def test_deltas_egaux_au_recalcul(app, donnees, cas):
+    changements = CHANGEMENTS[cas]
+    deltas = deltas_de(app, donnees, changements)
+    verifier_agregats(
+        app,
+        app['appliquer_deltas_journalier'](donnees['journalier'], deltas),
+        app['appliquer_deltas_cube'](donnees['cube'], deltas),
+        frame_recalculee(app, donnees, changements)
+    )
+
+
+@pytest.mark.parametrize("cas", list(CHANGEMENTS))
+def test_reporter_changements(app, donnees, cas):
+    changements = CHANGEMENTS[cas]
+    reportees = app['reporter_changements'](donnees, changements, 'v1')
+    df = frame_recalculee(app, donnees, changements)
+
+    assert reportees['version'] == 'v1'
+    pd.testing.assert_frame_equal(reportees['df'], df)
+    verifier_agregats(app, reportees['journalier'], reportees['cube'], df)
+    assert {reportees['versions_exercice'][app['calculer_exercice'](date)] for date in changements} == {'v1'}
+
+
+def test_date_en_double(app, donnees):
+    df = donnees['df'][COLONNES]
+    df = pd.concat([df, df.iloc[[10]]], ignore_index=True)
+    doublons = app['preparer_donnees'](df, 'v0')
+    assert app['reporter_changements'](doublons, {DATES[10]: (12.0, 1)}, 'v1') is None
+
+
+@pytest.mark.parametrize("cas", list(CHANGEMENTS))
+def test_tableau_mensuel_par_exercice(app, donnees, cas):
+    changements = CHANGEMENTS[cas]
+    app['tableau_montants_mensuels'](donnees, premier_exercice='')
+    reportees = app['reporter_changements'](donnees, changements, f'v1-{cas}')
+    recalculees = app['preparer_donnees'](frame_recalculee(app, donnees, changements)[COLONNES], f'v2-{cas}')
+    pd.testing.assert_frame_equal(
+        app['tableau_montants_mensuels'](reportees, premier_exercice=''),
+        app['tableau_montants_mensuels'](recalculees, premier_exercice='')
+    )